@@ -1,16 +1,21 @@
-import folium
 import openai
-import requests
 import streamlit as st
-import tiktoken
 import os
 import sys
-import yaml
+from resources import REGISTRY, export_creds, get_encoding_for_model, load_creds
+from map_render import cluster_map_html, overpass_points, reader_context, show_map_html
+from http_transport import TRANSPORT
+from overpass_cache import OverpassCache
+from conversation_memory import ConversationMemory
+from llm_cache import COMPLETION_CACHE
+from scheduler import SchedulerSaturated
+from metrics import METRICS, configure, sidebar_panel
 
-stream = open("./creds.yaml", "r")
-docs = yaml.safe_load(stream)
-for k, v in docs.items():
-    os.environ[k] = v
+docs = load_creds()
+export_creds(docs)
+
+# Start the metrics exporters enabled in creds.yaml
+configure(docs)
 
 # Define the Overpass API endpoint URL
 OVERPASS_API_URL = "https://overpass-api.de/api/interpreter"
@@ -43,13 +48,34 @@ Answer: {response}
 """
 
 # Create a tokenizer
-ENC = tiktoken.encoding_for_model("text-davinci-003")
+ENC = get_encoding_for_model("text-davinci-003")
+
+# Maximum number of tokens of conversation history included in each chat prompt
+HISTORY_TOKEN_BUDGET = 1000
+
+# Cache Overpass API responses on disk, so repeated queries skip the network; the cache is shared by
+# every session so that concurrent identical queries also share one request
+OVERPASS_CACHE = REGISTRY.get("app.overpass_cache", OverpassCache, uses_creds=False)
+
+# Define a function to send a query to the Overpass API
+def fetch_overpass(query, headers=None):
+    payload = {"data": query}
+    # The query only reads, so the POST is safe to retry like a GET
+    return TRANSPORT.post(OVERPASS_API_URL, data=payload, headers=headers, idempotent=True)
 
 # Define a function to query the Overpass API and return the JSON response
 def query_overpass(query):
-    payload = {"data": query}
-    response = requests.post(OVERPASS_API_URL, data=payload)
-    return response.json()
+    return OVERPASS_CACHE.get(query, fetch_overpass)
+
+# Define a function to get a text-davinci-003 completion, reusing cached answers for identical requests
+def complete(prompt, model="text-davinci-003", **params):
+    params = {"top_p": 1, "frequency_penalty": 0, "presence_penalty": 0, **params}
+
+    def create():
+        response = openai.Completion.create(model=model, prompt=prompt, **params)
+        return response["choices"][0]["text"]
+
+    return COMPLETION_CACHE.get_or_create(model, prompt, create, **params)
 
 # Define the Streamlit app
 def main():
@@ -63,43 +89,36 @@ def main():
     # Define the layout of the app
     col1, col2 = st.columns([1, 1])
 
-    if 'chat_history' not in st.session_state:
-        st.session_state.chat_history = ""
+    # The conversation memory keeps the history sent with each request within a fixed token budget
+    if 'memory' not in st.session_state:
+        st.session_state.memory = ConversationMemory(ENC, max_tokens=HISTORY_TOKEN_BUDGET)
 
     if 'overpass_query' not in st.session_state:
         st.session_state.overpass_query = None
 
-    if 'prompt_history' not in st.session_state:
-        st.session_state.prompt_history = ""
-
     # Define the query input box in the left pane
     with col1:
         chat = st.text_area("What can I help you find? :thinking_face:")
 
         if st.button("Ask"):
-            response = openai.Completion.create(
-                model="text-davinci-003",
-                prompt=CHAT_TEMPLATE.format(history=st.session_state.chat_history, human_input=chat),
-                temperature=0,
-                max_tokens=516,
-                top_p=1,
-                frequency_penalty=0,
-                presence_penalty=0
-            )
+            try:
+                answer = complete(CHAT_TEMPLATE.format(history=st.session_state.memory.render(), human_input=chat),
+                                  temperature=0, max_tokens=516)
+            except SchedulerSaturated as e:
+                # Too many requests are waiting for the model; the user can ask again in a moment
+                st.warning(str(e))
+                st.stop()
 
             # Display the response as pure text
-            st.write(response["choices"][0]["text"])
-
-            # Update the history string
-            st.session_state.chat_history = st.session_state.chat_history + f"Human: {chat}\nAssistant: {response['choices'][0]['text']}\n"
+            st.write(answer)
 
-            # Update the prompt history string
-            st.session_state.prompt_history = st.session_state.prompt_history + f"{chat} "
+            # Update the conversation memory
+            st.session_state.memory.add_turn(chat, answer)
 
             # Update the Overpass query. The query is enclosed by three backticks, denoting that is a code block.
             # does the response contain a query? If so, update the query
-            if "```" in response["choices"][0]["text"]:
-                st.session_state.overpass_query = response["choices"][0]["text"].split("```")[1]
+            if "```" in answer:
+                st.session_state.overpass_query = answer.split("```")[1]
             else:
                 st.session_state.overpass_query = None
 
@@ -110,43 +129,41 @@ def main():
                     # Query the Overpass API
                     response = query_overpass(st.session_state.overpass_query)
 
-                    # Check if the response is valid
-                    if "elements" in response and len(response["elements"]) > 0:
-                        # Create a new Folium map in the right pane
-                        m = folium.Map(location=[response["elements"][0]["lat"], response["elements"][0]["lon"]], zoom_start=11)
+                    points = overpass_points(response)
 
-                        # Add markers for each element in the response
-                        for element in response["elements"]:
-                            if "lat" in element and "lon" in element:
-                                folium.Marker([element["lat"], element["lon"]]).add_to(m)
+                    # Check if the response is valid
+                    if points:
+                        # Create a new Folium map in the right pane, with the elements in one clustered layer
+                        with METRICS.span("map.build"):
+                            html = cluster_map_html(points, zoom_start=11)
 
                         # Display the map
-                        st.write(m)
-
-                        # If the request for summary of the API response is shorter than 1500 tokens,
-                        # use the Reader model to generate a response
-
-                        query_reader_prompt  = READER_TEMPLATE.format(prompt=st.session_state.prompt_history,
-                                                                      response=str(response))
-                        query_reader_prompt_tokens = len(ENC.encode(query_reader_prompt))
-                        if query_reader_prompt_tokens < 1500:
-
-                            response = openai.Completion.create(
-                                model="text-davinci-003",
-                                prompt=query_reader_prompt,
-                                temperature=0.5,
-                                max_tokens=2047 - query_reader_prompt_tokens,
-                                top_p=1,
-                                frequency_penalty=0,
-                                presence_penalty=0
-                            )
-
-                            # Display the response as pure text
-                            st.write(response["choices"][0]["text"])
+                        with METRICS.span("map.render"):
+                            show_map_html(html)
+
+                        # Give the Reader model the names, tags and coordinates of as many elements as fit,
+                        # keeping the whole request for a summary of the API response under 1500 tokens
+                        history = st.session_state.memory.human_history()
+                        template_tokens = len(ENC.encode(READER_TEMPLATE.format(prompt=history, response="")))
+                        context, included, total = reader_context(response, ENC, 1500 - template_tokens)
+                        if included > 0:
+                            query_reader_prompt = READER_TEMPLATE.format(prompt=history, response=context)
+                            query_reader_prompt_tokens = len(ENC.encode(query_reader_prompt))
+
+                            try:
+                                summary = complete(query_reader_prompt, temperature=0.5,
+                                                   max_tokens=2047 - query_reader_prompt_tokens)
+                            except SchedulerSaturated as e:
+                                st.warning(str(e))
+                            else:
+                                # Display the response as pure text
+                                st.write(summary)
                         else:
                             st.write("The API response is too long for me to read. Try asking for something slightly more specific! :smile:")
                     else:
                         st.write("No results found :cry:")
 
+    sidebar_panel(docs)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
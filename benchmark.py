@@ -0,0 +1,607 @@
+"""Benchmarks the apps' core code paths offline, against local stand-ins for every upstream service.
+
+OpenAI, Pinecone, OSM and Overpass are replaced by deterministic fakes with
+configurable latency and payload size, and the places dataset by synthetic CSVs
+of the requested sizes. Each case reports throughput, latency percentiles and
+the peak memory allocated while it runs.
+
+    python benchmark.py --rows 10000 100000 1000000
+    python benchmark.py --only places map --rows 10000000 --output bench_output.txt
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+TOWNS = ["Rhodes", "Lindos", "Faliraki", "Chania", "Rethymno", "Heraklion", "Fira", "Oia", "Naxos", "Paros",
+         "Mykonos", "Ermoupoli", "Corfu", "Argostoli", "Zakynthos", "Nafplio", "Kalamata", "Volos", "Thessaloniki",
+         "Athens", "Piraeus", "Kos", "Samos", "Ikaria", "Amorgos", "Milos", "Sifnos", "Hydra", "Spetses", "Skiathos"]
+STREETS = ["Akti", "Odos", "Leoforos", "Plateia", "Paralia", "Agiou", "Kanari", "Miaouli", "Ermou", "Athinas"]
+TYPES = ["restaurant", "cafe", "bar", "night_club", "museum", "beach", "park", "church", "hotel", "lodging",
+         "tourist_attraction", "point_of_interest", "establishment", "food", "store", "bakery", "art_gallery",
+         "shopping_mall", "spa", "gym", "campground", "marina", "hiking_area", "natural_feature", "library",
+         "movie_theater", "zoo", "aquarium", "amusement_park", "place_of_worship"]
+QUANTILES = (50, 95, 99)
+
+
+def synthetic_places(rows, seed=0, start=0):
+    """Returns a DataFrame shaped like places_greece.csv with `rows` deterministic fake places."""
+    rng = np.random.default_rng(seed + start)
+    ids = np.arange(start, start + rows)
+    towns = np.asarray(TOWNS)[rng.integers(0, len(TOWNS), rows)]
+    streets = np.asarray(STREETS)[rng.integers(0, len(STREETS), rows)]
+    numbers = rng.integers(1, 200, rows).astype(str)
+    # One to four types per place, skewed towards the common ones
+    weights = 1.0 / np.arange(1, len(TYPES) + 1)
+    picks = rng.choice(len(TYPES), size=(rows, 4), p=weights / weights.sum())
+    counts = rng.integers(1, 5, rows)
+    has_type = [", ".join(dict.fromkeys(TYPES[t] for t in row[:n])) for row, n in zip(picks, counts)]
+    rating = np.round(rng.uniform(1, 5, rows), 1)
+    rating[rng.random(rows) < 0.05] = np.nan
+    return pd.DataFrame({
+        "place_id": ids,
+        "place_name": pd.Series(ids).map("Place {}".format),
+        "place_address": pd.Series(streets) + " " + numbers + ", " + pd.Series(towns) + ", Greece",
+        "has_type": has_type,
+        "rating": rating,
+        "latitude": rng.uniform(34.8, 41.7, rows),
+        "longitude": rng.uniform(19.4, 28.2, rows),
+    })
+
+
+def write_synthetic_csv(path, rows, chunksize=1_000_000, seed=0):
+    """Writes a synthetic places CSV in chunks, so tens of millions of rows fit in memory."""
+    for start in range(0, rows, chunksize):
+        chunk = synthetic_places(min(chunksize, rows - start), seed=seed, start=start)
+        chunk.to_csv(path, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    return path
+
+
+class FakeLLM:
+    """Deterministic completion endpoint: a fixed delay to the first token, then a steady token rate.
+
+    The text is derived from a hash of the prompt (or given explicitly), so
+    repeated runs produce the same output and the same cache behaviour.
+    """
+
+    def __init__(self, first_token_latency=0.05, tokens_per_second=2000.0, output_tokens=200):
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def text(self, prompt):
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        return " ".join(rng.choice(TOWNS + TYPES + STREETS) for _ in range(self.output_tokens))
+
+    def stream(self, prompt, text=None):
+        """Yields the completion in chunks of about one token, pacing them like a streaming response."""
+        with self.lock:
+            self.calls += 1
+        text = self.text(prompt) if text is None else text
+        time.sleep(self.first_token_latency)
+        chunks = [text[i:i + 4] for i in range(0, len(text), 4)]
+        interval = 1.0 / self.tokens_per_second if self.tokens_per_second else 0.0
+        start = time.perf_counter()
+        for i, chunk in enumerate(chunks):
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            yield chunk
+
+    def complete(self, prompt, text=None):
+        return "".join(self.stream(prompt, text))
+
+
+class RateLimitError(Exception):
+    """Raised by FakeProvider like openai.error.RateLimitError, which the scheduler recognizes by name."""
+
+
+class FakeProvider:
+    """Completion endpoint with request and token limits per period, answering 429 beyond them.
+
+    Like OpenAI's, the limits are buckets replenished continuously over the period.
+    """
+
+    def __init__(self, requests_per_period, tokens_per_period, period=60.0, latency=0.05):
+        self.limits = (requests_per_period, tokens_per_period)
+        self.levels = list(self.limits)
+        self.period = period
+        self.latency = latency
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.rate_limited = 0
+
+    def complete(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            self.levels = [min(limit, level + (now - self.updated) * limit / self.period)
+                           for level, limit in zip(self.levels, self.limits)]
+            self.updated = now
+            if self.levels[0] < 1 or self.levels[1] < tokens:
+                self.rate_limited += 1
+                raise RateLimitError("Rate limit reached")
+            self.levels = [self.levels[0] - 1, self.levels[1] - tokens]
+            self.calls += 1
+        time.sleep(self.latency)
+        return "ok"
+
+
+def fake_itinerary(location, days, places_per_day, seed=0):
+    """Returns the JSON itinerary test_parse_output.py asks the model for."""
+    rng = random.Random(f"{location}:{seed}")
+    itinerary = {f"Day {day}": {"places": [f"{rng.choice(STREETS)} {rng.randint(1, 99)}, {location}"
+                                           for _ in range(places_per_day)]}
+                 for day in range(1, days + 1)}
+    return json.dumps([{"location": location, "summary": f"A trip to {location}.", "duration": days,
+                        "activities": ["beach", "museum"], "itinerary": itinerary}], indent=2)
+
+
+class FakeGeocoder:
+    """Geocoding function with a fixed latency, returning a stable coordinate for each place."""
+
+    def __init__(self, latency=0.02, miss_rate=0.05):
+        self.latency = latency
+        self.miss_rate = miss_rate
+        self.calls = 0
+
+    def __call__(self, place):
+        self.calls += 1
+        time.sleep(self.latency)
+        digest = hashlib.sha256(place.encode("utf-8")).digest()
+        if digest[0] / 255 < self.miss_rate:
+            return None
+        return 34.8 + digest[1] / 255 * 6.9, 19.4 + digest[2] / 255 * 8.8
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200):
+        self.data = data
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.headers = {"ETag": hashlib.sha1(json.dumps(data).encode("utf-8")).hexdigest()}
+
+    def json(self):
+        return self.data
+
+
+class FakeOverpass:
+    """Overpass endpoint with a fixed latency, answering every query with `elements` named nodes and ways."""
+
+    def __init__(self, latency=0.2, elements=1000, seed=0):
+        self.latency = latency
+        self.elements = elements
+        self.seed = seed
+        self.calls = 0
+
+    def response(self):
+        rng = np.random.default_rng(self.seed)
+        lats, lons = rng.uniform(35, 41, self.elements), rng.uniform(20, 28, self.elements)
+        elements = []
+        for i, (lat, lon) in enumerate(zip(lats.tolist(), lons.tolist())):
+            tags = {"amenity": TYPES[i % len(TYPES)], "source": "survey", "name:en": f"Place {i}"}
+            if i % 3:
+                tags["name"] = f"Place {i}"
+            if i % 4 == 0:
+                elements.append({"type": "way", "id": i, "center": {"lat": lat, "lon": lon}, "tags": tags})
+            else:
+                elements.append({"type": "node", "id": i, "lat": lat, "lon": lon, "tags": tags})
+        return {"elements": elements}
+
+    def __call__(self, query, headers=None):
+        self.calls += 1
+        time.sleep(self.latency)
+        if headers and headers.get("If-None-Match"):
+            return FakeResponse(None, status_code=304)
+        return FakeResponse(self.response())
+
+
+def summarize(name, latencies, peak_bytes, **extra):
+    """Returns one result row: throughput, latency percentiles in ms and peak allocated memory in MB."""
+    latencies = np.asarray(latencies, dtype=np.float64)
+    total = latencies.sum()
+    result = {"case": name, "n": len(latencies), "ops_per_s": len(latencies) / total if total else float("inf")}
+    for q, value in zip(QUANTILES, np.percentile(latencies, QUANTILES)):
+        result[f"p{q}_ms"] = value * 1000
+    result["peak_mb"] = None if peak_bytes is None else peak_bytes / 2 ** 20
+    result.update(extra)
+    return result
+
+
+def measure(name, fn, iterations, warmup=1, **extra):
+    """Times `iterations` calls of fn(i) after `warmup` untimed ones.
+
+    Peak memory is taken from one extra traced call, fn(iterations), so tracing
+    does not slow down the timed ones.
+    """
+    for i in range(warmup):
+        fn(i)
+    peak = traced_peak(lambda: fn(iterations))
+    latencies = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        latencies.append(time.perf_counter() - start)
+    return summarize(name, latencies, peak, **extra)
+
+
+def traced_peak(fn):
+    """Returns the peak memory allocated by Python and numpy while fn() runs."""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure_once(name, fn, trace=True, **extra):
+    """Times a single call, for expensive one-off steps such as building an index.
+
+    Tracing slows allocation-heavy code down severalfold, so with `trace` the
+    step is run a second time, traced, for its peak memory.
+    """
+    start = time.perf_counter()
+    value = fn()
+    elapsed = time.perf_counter() - start
+    return value, summarize(name, [elapsed], traced_peak(fn) if trace else None, **extra)
+
+
+def sample_queries(count, seed=0):
+    """Returns (location, filters) pairs drawn from the dataset, like users picking from the UI."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        location = rng.choice(TOWNS) + ", Greece"
+        queries.append((location, rng.sample(TYPES[:12], rng.randint(1, 3))))
+    return queries
+
+
+def bench_places(args, rows, csv_path):
+    """Loading the places dataset, generate_map's address and radius queries and the filter widget's options."""
+    from places_index import PlacesIndex, extract_unique_filters
+    from places_store import PlacesStore
+
+    results = []
+    data, result = measure_once("places.read_csv", lambda: pd.read_csv(csv_path), rows=rows)
+    results.append(result)
+    store, result = measure_once("places.encode", lambda: PlacesStore.from_frame(data), rows=rows)
+    results.append(result)
+    store_directory = tempfile.mkdtemp(prefix="bench_store_")
+    try:
+        _, result = measure_once("places.save", lambda: store.save(store_directory), trace=False, rows=rows)
+        results.append(result)
+        # What each worker process pays at startup once the CSV has been converted
+        index, result = measure_once("places.load_index",
+                                     lambda: PlacesIndex(PlacesStore.load(store_directory)), rows=rows)
+        results.append(result)
+        queries = sample_queries(args.iterations)
+        results.append(measure("places.top_places", lambda i: index.top_places(*queries[i % len(queries)], 10),
+                               args.iterations, rows=rows))
+
+        # Points spread over the synthetic places' bounding box, as geocoded locations
+        points = [(34.8 + 6.9 * ((i * 0.618) % 1), 19.4 + 8.8 * ((i * 0.382) % 1)) for i in range(len(queries))]
+        results.append(measure("places.top_places_near",
+                               lambda i: index.top_places_near(points[i % len(points)], 25, queries[i % len(queries)][1],
+                                                               10),
+                               args.iterations, rows=rows))
+        results.append(measure("places.top_places_around",
+                               lambda i: index.top_places_around(queries[i % len(queries)][0], points[i % len(points)],
+                                                                 25, queries[i % len(queries)][1], 10),
+                               args.iterations, rows=rows))
+        results.append(measure("places.nearest", lambda i: index.spatial.nearest(*points[i % len(points)], 10),
+                               args.iterations, rows=rows))
+
+        # Itinerary place names, as the model writes them
+        results.append(measure("places.match_name", lambda i: index.names.match(f"place {(i * 7919) % rows}"),
+                               args.iterations, rows=rows))
+
+        def facet_options(i):
+            # Uncached, as on the first rerun for a location
+            index.facets.cache.clear()
+            return index.facets.options(queries[i % len(queries)][0])
+
+        results.append(measure("places.facet_options", facet_options, args.iterations, rows=rows))
+    finally:
+        shutil.rmtree(store_directory, ignore_errors=True)
+    results.append(measure("places.extract_unique_filters", lambda i: extract_unique_filters(data),
+                           max(1, args.iterations // 20), rows=rows))
+    return results
+
+
+def bench_map(args, rows, csv_path):
+    """generate_map and get_map: folium maps of the selected places, rendered to HTML, and the rendered-HTML cache."""
+    from map_render import MapHtmlCache, coordinates_map, map_html, places_map, places_map_html
+    from places_index import PlacesIndex
+
+    index = PlacesIndex.from_csv(csv_path, csv_path + ".store")
+    queries = sample_queries(args.iterations)
+    selections = [index.top_places(location, filters, 10) for location, filters in queries]
+    selections = [s for s in selections if len(s)] or [index.store.frame(range(10))]
+    html_bytes = len(map_html(places_map(selections[0])))
+
+    def render(i):
+        map_html(places_map(selections[i % len(selections)]))
+
+    # Reruns showing the same places, e.g. after an unrelated widget changed
+    cache = MapHtmlCache()
+    for selection in selections:
+        places_map_html(selection, cache=cache)
+
+    coordinates = {row.place_name: (row.latitude, row.longitude) for row in index.store.frame(range(20)).itertuples()}
+    return [
+        measure("map.places_map", render, args.iterations, rows=rows, html_kb=html_bytes / 1024),
+        measure("map.places_map_cached", lambda i: places_map_html(selections[i % len(selections)], cache=cache),
+                args.iterations, rows=rows),
+        measure("map.coordinates_map", lambda i: map_html(coordinates_map(coordinates)), args.iterations),
+    ]
+
+
+def bench_get_places(args):
+    """test_parse_output.py's load_LLM: stream the JSON itinerary and geocode each place as it arrives."""
+    from geocoding import GeocodeCache
+    from json_stream import ItineraryPlacesParser
+
+    results = []
+    directory = tempfile.mkdtemp(prefix="bench_geocode_")
+    try:
+        geocode = FakeGeocoder(latency=args.service_latency)
+        llm = FakeLLM(args.llm_latency, args.tokens_per_second)
+        cache = GeocodeCache(os.path.join(directory, "geocode.sqlite"), geocode=geocode, rate_limit=0)
+
+        def run(i):
+            text = fake_itinerary(TOWNS[i % len(TOWNS)], days=3, places_per_day=4, seed=i)
+            pending = {}
+            with ThreadPoolExecutor(max_workers=cache.max_workers) as pool:
+                def on_place(day, place):
+                    if place not in pending:
+                        pending[place] = pool.submit(cache.resolve, place)
+
+                parser = ItineraryPlacesParser(on_place)
+                for chunk in llm.stream(text, text):
+                    parser.feed(chunk)
+                return {place: future.result() for place, future in pending.items()}
+
+        # Each call plans a different trip, so the first pass geocodes every place and the second finds them cached
+        cold = measure("get_places.streaming_cold", run, args.iterations, warmup=0)
+        cold["upstream_calls"] = geocode.calls
+        results.append(cold)
+        results.append(measure("get_places.streaming_warm", run, args.iterations, warmup=0))
+
+        places = [f"{street} {n}, Rhodes" for street in STREETS for n in range(10)]
+        results.append(measure("get_places.resolve_many_warm", lambda i: cache.resolve_many(places), args.iterations))
+        cache.close()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def bench_completions(args):
+    """The load_LLM variants' completion path: cache lookups, misses and coalescing under concurrency."""
+    from llm_cache import CompletionCache
+    from scheduler import Scheduler
+
+    llm = FakeLLM(args.llm_latency, args.tokens_per_second)
+    # No limits: this case measures caching and coalescing, not rate limiting
+    cache = CompletionCache(scheduler=Scheduler())
+    rng = np.random.default_rng(0)
+    # Popular destinations dominate traffic, so prompts follow a Zipf distribution
+    prompts = [f"Plan a trip to {TOWNS[(k - 1) % len(TOWNS)]} variant {k}" for k in rng.zipf(1.3, 4 * args.iterations)]
+
+    def run(i):
+        prompt = prompts[i % len(prompts)]
+        return cache.get_or_create("fake-llm", prompt, lambda: llm.complete(prompt), temperature=0)
+
+    latencies = []
+
+    def timed(i):
+        start = time.perf_counter()
+        run(i)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies.extend(pool.map(timed, range(len(prompts))))
+    wall = time.perf_counter() - start
+    # Cached completions are small strings; what matters here is upstream calls and waiting time
+    result = summarize("llm.cached_completion", latencies, None, upstream_calls=llm.calls, **cache.stats())
+    # Requests overlap, so throughput is measured against wall-clock time
+    result["ops_per_s"] = len(latencies) / wall
+    return [result]
+
+
+def bench_retrieval(args, rows):
+    """main.py's load_LLM retrieval: embed the question and query the local vector store."""
+    from local_vector_store import LocalVectorStore, fake_embed_batch
+    from retrieval import QueryEmbedder, Retriever
+
+    documents = synthetic_places(min(rows, args.max_vectors))
+    texts = (documents["place_name"] + ". " + documents["has_type"] + ". " + documents["place_address"]).tolist()
+    store = LocalVectorStore(256)
+    _, build = measure_once("retrieval.upsert", lambda: store.upsert(
+        (str(i), vector, {"text": text}) for i, (vector, text) in enumerate(zip(fake_embed_batch(texts), texts))
+    ), rows=len(texts))
+    queries = [f"{location}: {' '.join(filters)}" for location, filters in sample_queries(args.iterations)]
+    retriever = Retriever(store, QueryEmbedder(fake_embed_batch))
+    results = [build, measure("retrieval.flat", lambda i: retriever.retrieve(queries[i % len(queries)]),
+                              args.iterations, rows=len(texts))]
+    store.build_ivf()
+    results.append(measure("retrieval.ivf", lambda i: retriever.retrieve(queries[i % len(queries)]),
+                           args.iterations, rows=len(texts)))
+    return results
+
+
+def bench_overpass(args):
+    """app.py's query and render flow: cached Overpass query, clustered map, reader context."""
+    from map_render import cluster_map, map_html, overpass_points, reader_context
+    from overpass_cache import OverpassCache
+    from resources import get_encoding_for_model
+
+    encoding = get_encoding_for_model("text-davinci-003")
+    fetch = FakeOverpass(args.service_latency, args.elements)
+    directory = tempfile.mkdtemp(prefix="bench_overpass_")
+    try:
+        cache = OverpassCache(directory)
+
+        def run(i):
+            response = cache.get(f'node["amenity"="cafe"](around:{1000 + i},36.43,28.22);out center;', fetch)
+            points = overpass_points(response)
+            html = map_html(cluster_map(points))
+            reader_context(response, encoding, 1500)
+            return len(html)
+
+        html_bytes = run(-1)
+        # Each call sends a different query, so the first pass fetches every response and the second reads the cache
+        return [measure("overpass.query_render_cold", run, args.iterations, warmup=0,
+                        elements=args.elements, html_kb=html_bytes / 1024),
+                measure("overpass.query_render_warm", run, args.iterations, warmup=0, elements=args.elements)]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def format_result(result):
+    extra = ", ".join(f"{k}={v:.3g}" if isinstance(v, float) else f"{k}={v}"
+                      for k, v in result.items()
+                      if k not in ("case", "n", "ops_per_s", "peak_mb") and not k.endswith("_ms"))
+    return (f"{result['case']:<32} n={result['n']:<6} {result['ops_per_s']:>10.1f} ops/s  "
+            + "  ".join(f"p{q}={result[f'p{q}_ms']:.2f}ms" for q in QUANTILES)
+            + ("" if result["peak_mb"] is None else f"  peak={result['peak_mb']:.1f}MB")
+            + (f"  {extra}" if extra else ""))
+
+
+def bench_scheduler(args):
+    """Sessions calling a rate-limited provider at once, retrying on 429 or queued by the scheduler.
+
+    Limits are per minute, and a minute lasts 60 / --time-scale seconds. One
+    request in four is background work; the scheduler is set 5% below the
+    provider's limits to absorb timing differences.
+    """
+    from scheduler import BACKGROUND, INTERACTIVE, PRIORITY_NAMES, Scheduler, SchedulerSaturated
+
+    period = 60.0 / args.time_scale
+    rng = np.random.default_rng(0)
+    costs = rng.integers(200, 1200, 4 * args.iterations).tolist()
+    levels = [BACKGROUND if i % 4 == 0 else INTERACTIVE for i in range(len(costs))]
+
+    def unscheduled(provider, i):
+        # Each session retries on its own after a fixed back-off, as the apps did without the scheduler
+        for _ in range(5):
+            try:
+                return provider.complete(costs[i])
+            except RateLimitError:
+                time.sleep(period / 10)
+        return "failed"
+
+    def scheduled(provider, scheduler, i):
+        try:
+            return scheduler.run(costs[i], lambda: provider.complete(costs[i]), level=levels[i])
+        except SchedulerSaturated:
+            return "rejected"
+        except RateLimitError:
+            return "failed"
+
+    results = []
+    for name in ("unscheduled", "scheduled"):
+        provider = FakeProvider(args.requests_per_minute, args.provider_tokens_per_minute, period, args.llm_latency)
+        scheduler = Scheduler(0.95 * args.requests_per_minute, 0.95 * args.provider_tokens_per_minute,
+                              max_queue=4 * args.concurrency, max_wait=period / 2, period=period)
+
+        def timed(i):
+            start = time.perf_counter()
+            outcome = unscheduled(provider, i) if name == "unscheduled" else scheduled(provider, scheduler, i)
+            return outcome, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            outcomes = list(pool.map(timed, range(len(costs))))
+        for level in (INTERACTIVE, BACKGROUND):
+            rows = [outcome for outcome, l in zip(outcomes, levels) if l == level]
+            results.append(summarize(f"scheduler.{name}.{PRIORITY_NAMES[level]}", [t for _, t in rows], None,
+                                     ok=sum(o == "ok" for o, _ in rows),
+                                     rejected=sum(o == "rejected" for o, _ in rows),
+                                     failed=sum(o == "failed" for o, _ in rows),
+                                     upstream_429=provider.rate_limited))
+    return results
+
+
+BENCHMARKS = ["places", "map", "get_places", "completions", "retrieval", "overpass", "scheduler"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000], help="synthetic CSV sizes")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=BENCHMARKS)
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per case")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent sessions for the completion case")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="fake LLM time to first token, in s")
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0, help="fake LLM streaming rate")
+    parser.add_argument("--requests-per-minute", type=float, default=300, help="fake provider request limit")
+    parser.add_argument("--provider-tokens-per-minute", type=float, default=150_000,
+                        help="fake provider token limit")
+    parser.add_argument("--time-scale", type=float, default=60.0, help="speed-up of the rate-limit clock")
+    parser.add_argument("--service-latency", type=float, default=0.02, help="fake geocoder/Overpass latency, in s")
+    parser.add_argument("--elements", type=int, default=2000, help="elements in each fake Overpass response")
+    parser.add_argument("--max-vectors", type=int, default=100_000, help="cap on the vectors indexed for retrieval")
+    parser.add_argument("--data-dir", default=None, help="where synthetic CSVs are kept (default: a temp dir)")
+    parser.add_argument("--output", default=None, help="append the results as JSON lines to this file")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench_data_")
+    os.makedirs(data_dir, exist_ok=True)
+    results = []
+
+    def report(rows):
+        for result in rows:
+            print(format_result(result), flush=True)
+        results.extend(rows)
+
+    try:
+        for rows in args.rows:
+            if {"places", "map"} & set(args.only):
+                csv_path = os.path.join(data_dir, f"places_{rows}.csv")
+                if not os.path.exists(csv_path):
+                    _, result = measure_once("data.write_csv", lambda: write_synthetic_csv(csv_path, rows),
+                                             trace=False, rows=rows)
+                    report([result])
+                if "places" in args.only:
+                    report(bench_places(args, rows, csv_path))
+                if "map" in args.only:
+                    report(bench_map(args, rows, csv_path))
+            if "retrieval" in args.only:
+                report(bench_retrieval(args, rows))
+        if "get_places" in args.only:
+            report(bench_get_places(args))
+        if "completions" in args.only:
+            report(bench_completions(args))
+        if "overpass" in args.only:
+            report(bench_overpass(args))
+        if "scheduler" in args.only:
+            report(bench_scheduler(args))
+    finally:
+        if args.data_dir is None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    # ru_maxrss is in KiB on Linux: the high-water mark of the whole run, including numpy and pandas buffers
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Peak resident memory of the run: {max_rss_mb:.0f} MB")
+    if args.output:
+        run = {"time": time.time(), "args": vars(args), "max_rss_mb": max_rss_mb}
+        with open(args.output, "a") as f:
+            for result in results:
+                f.write(json.dumps({**run, **result}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+from collections import deque
+
+
+class ConversationMemory:
+    """Chat history for prompt templates, kept within a token budget.
+
+    Each turn is tokenized once when it is added and its count is kept, so the
+    running total never requires re-encoding the history. Once the total exceeds
+    `max_tokens`, the oldest turns are dropped. If a `summarize(summary, turns)`
+    function is given, dropped turns are folded into a running summary instead,
+    capped at a quarter of the budget, which is rendered ahead of the kept turns.
+    """
+
+    def __init__(self, encoding, max_tokens=1000, summarize=None):
+        self.encoding = encoding
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        # Each turn is (human, assistant, rendered text, token count)
+        self.turns = deque()
+        self.total_tokens = 0
+        self.summary = ""
+        self.summary_tokens = 0
+
+    def add_turn(self, human, assistant):
+        text = f"Human: {human}\nAssistant: {assistant}\n"
+        tokens = len(self.encoding.encode(text))
+        self.turns.append((human, assistant, text, tokens))
+        self.total_tokens += tokens
+        self._trim()
+
+    def _trim(self):
+        while True:
+            dropped = []
+            while self.turns and self.total_tokens + self.summary_tokens > self.max_tokens:
+                turn = self.turns.popleft()
+                self.total_tokens -= turn[3]
+                dropped.append(turn)
+            if not dropped or self.summarize is None:
+                return
+            self._fold(dropped)
+
+    def _fold(self, dropped):
+        summary = self.summarize(self.summary, [(human, assistant) for human, assistant, _, _ in dropped])
+        tokens = self.encoding.encode(summary)[:self.max_tokens // 4]
+        self.summary = self.encoding.decode(tokens)
+        self.summary_tokens = len(tokens)
+
+    def render(self):
+        """Returns the history in the "Human: ... Assistant: ..." format of CHAT_TEMPLATE."""
+        prefix = f"Summary of the earlier conversation: {self.summary}\n" if self.summary else ""
+        return prefix + "".join(text for _, _, text, _ in self.turns)
+
+    def human_history(self):
+        """Returns the user's messages that are still in memory, separated by spaces."""
+        return "".join(f"{human} " for human, _, _, _ in self.turns)
+
+    def __len__(self):
+        return len(self.turns)
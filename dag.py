@@ -0,0 +1,79 @@
+import asyncio
+import time
+from collections import namedtuple
+
+# A unit of work: `run` receives a dict of the DAG inputs and the results of its dependencies
+Stage = namedtuple("Stage", ["name", "run", "deps"])
+
+
+def stage(name, run, deps=()):
+    return Stage(name, run, tuple(deps))
+
+
+class StageTiming(namedtuple("StageTiming", ["start", "end"])):
+    """Start and end of a stage, in seconds since the DAG started."""
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+
+def _check(stages, inputs):
+    # Dependencies must be inputs or earlier stages, which also rules out cycles
+    names = set(inputs)
+    for s in stages:
+        if s.name in names:
+            raise ValueError(f"Duplicate stage or input name: {s.name}")
+        missing = [d for d in s.deps if d not in names]
+        if missing:
+            raise ValueError(f"Stage {s.name} depends on unknown or later stages: {', '.join(missing)}")
+        names.add(s.name)
+
+
+async def _run_dag(stages, inputs, executor):
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    timings = {}
+    tasks = {}
+
+    async def run_stage(s):
+        values = dict(inputs)
+        for dep in s.deps:
+            if dep in tasks:
+                values[dep] = await tasks[dep]
+        # Stages block on network calls, so each runs in a worker thread while the loop waits on the others
+        began = time.perf_counter() - start
+        result = await loop.run_in_executor(executor, s.run, values)
+        timings[s.name] = StageTiming(began, time.perf_counter() - start)
+        return result
+
+    for s in stages:
+        tasks[s.name] = asyncio.ensure_future(run_stage(s))
+    try:
+        results = dict(zip(tasks, await asyncio.gather(*tasks.values())))
+    finally:
+        for task in tasks.values():
+            task.cancel()
+    return results, timings, time.perf_counter() - start
+
+
+def run_dag(stages, inputs=None, executor=None):
+    """Runs the stages concurrently, each as soon as its dependencies have finished.
+
+    Stages are listed in dependency order. Returns (results, timings, wall) where
+    results and timings are keyed by stage name. `executor` is the concurrent.futures executor the stages run in (the
+    event loop's default thread pool if None). The first stage to fail cancels
+    the ones that have not started and its exception is raised.
+    """
+    inputs = dict(inputs or {})
+    _check(stages, inputs)
+    return asyncio.run(_run_dag(stages, inputs, executor))
+
+
+def format_timings(timings, wall):
+    """Returns one line per stage plus the wall-clock time against the serial sum."""
+    lines = [f"{name}: {t.start:.2f}–{t.end:.2f} s ({t.duration:.2f} s)"
+             for name, t in sorted(timings.items(), key=lambda item: item[1].start)]
+    serial = sum(t.duration for t in timings.values())
+    lines.append(f"Wall clock {wall:.2f} s, {serial:.2f} s if run one after another.")
+    return "  \n".join(lines)
@@ -0,0 +1,45 @@
+# Destination descriptions used as examples in the recommendation prompts and indexed for retrieval
+DESTINATIONS = [
+    {
+        "name": "Amorgos",
+        "country": "Greece",
+        "text": "Amorgos is a paradise for explorers, divers, and hikers. Its small bays, mountain paths and all-white churches, make it the ideal destination for an alternative Cycladic holiday. You should visit Ammos AMORGOS, a beach bar with a great view of the sea and the sunset.",
+    },
+    {
+        "name": "Catania",
+        "country": "Italy",
+        "text": "Catania in Sicily has a long history in a picturesque scene. With Aetna on its backdrop it offers a lot to lovers of Nature. Moreover, it's on the water and has beautiful beaches with turquoise waters. Visit Villa Bellini, a beautiful park in the heart of the city.",
+    },
+    {
+        "name": "Samothrace",
+        "country": "Greece",
+        "text": "Samothrace in the north east Aegean is famed for its wild mountain, Saos, that towers on the island and attracts travelers who prefer alternative types of tourism beyond the standard Greek island beach vibes (which if you wish, you can also indulge in here). Mount Saos is the highest mountain in the Aegean and its gorges, forests and waterfalls make for great exploring and action. Its peak, called Fegari (Moon), is at an impressive and panoramic height of 1.611 metres (5,285ft) and according to Homer, is where Poseidon watched the Achaeans, led by King Agamemnon, besiege Troy.",
+    },
+    {
+        "name": "Epidaurus",
+        "country": "Greece",
+        "text": "Ancient Epidaurus is a must for lovers of culture. Not just one of the most significant archaeological sites in Greece, but also a place that has managed to become a travel destination by preserving its ancient identity, keeping its theatre in operation, and hosting dozens of shows each year.",
+    },
+    {
+        "name": "Paros",
+        "country": "Greece",
+        "text": "Paros has a healthy art scene with numerous galleries and public spaces given over to exhibitions. Paros Park hosts a series of summer events, such as concerts in the amphitheatre and films under the stars at Cine Enastron. Also in summer, a week never seems to pass without some celebration or feast day.",
+    },
+    {
+        "name": "Samos",
+        "country": "Greece",
+        "text": "Experience Samos and its vibrant nightlife, a North Aegean Island in Greece. An array of bars caters to diverse tastes. From sophisticated artistic soirees to lively waterfront dance parties and themed nights, Samos offers a unique blend of ambiance and entertainment. In Iera Odos, an establishment exuding class, you’ll find erudite crowds drawn to its intellectual ambiance, artistic events, and live music.",
+    },
+    {
+        "name": "Mykonos",
+        "country": "Greece",
+        "text": "Mykonos is perhaps the epicenter of nightlife in Greece and for a good reason. Savor a selection of Mykonos’s finest Greek wines during a wine-tasting tour. Visit the island’s most famous beaches, including Super Paradise, Paradise, and Paraga.",
+    },
+]
+
+# Example locations per country, shown to the model for the country the user picked
+COUNTRY_LOCATIONS = {
+    "Italy": "Palermo, Catania, Taormina, Syracuse, Agrigento, Ragusa, Cefalù, Aeolian Islands, Lipari, Stromboli, Panarea, Vulcano, Salina, Filicudi, Alicudi, Favignana, Pantelleria, Lampedusa, Ustica, San Vito Lo Capo, Scopello, Trapani, Marsala, Erice, Selinunte, Segesta, Monreale, Noto, Modica, Piazza Armerina, Enna, Messina, Milazzo, Tindari, Etna, Alcantara Gorges, Nebrodi Mountains, Naples",
+    "Greece": "Amorgos, Rhodes, Santorini, Agathonisi, Chalki, Leros, Ikaria, Samothrace, Thasos, Agios Nikolaos, Skiathos, Zakynthos, Corfu, Nafplio, Spetses, Kilkis, Prespes, Lefkada, Volos, Mani, Elafonisos, Kythera",
+    "Spain": "Barcelona, Malaga, Bilbao, Tenerife, Valencia, Madrid, Ibiza, Majorca, Menorca, Lanzarote, La Palma, La Gomera, El Hierro",
+}
@@ -0,0 +1,179 @@
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from http_transport import TRANSPORT
+from metrics import METRICS
+from single_flight import SingleFlight
+
+
+def normalize_key(place):
+    """Returns the cache key for a place name: casefolded, punctuation stripped, single-spaced."""
+    key = re.sub(r"[^\w\s]", " ", str(place).casefold())
+    return " ".join(key.split())
+
+
+def osm_geocode(place):
+    """Geocodes a place with OpenStreetMap, returning (lat, lng) or None if it was not found."""
+    import geocoder
+
+    # geocoder only needs a session-like object, so requests share the pooled transport
+    g = geocoder.osm(place, session=TRANSPORT)
+    if g.ok:
+        return (g.lat, g.lng)
+    return None
+
+
+class RateLimiter:
+    """Spaces out calls so that at most `rate` of them start per second, across threads."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class GeocodeCache:
+    """Persistent place -> (lat, lng) cache in SQLite in front of a geocoding function.
+
+    Places that were not found are stored as negative results and retried after
+    `negative_ttl` seconds. The least recently used entries are evicted once the
+    cache holds more than `max_entries` places. `geocode` is any callable taking a
+    place name and returning (lat, lng) or None, so a stub can be used offline.
+    Concurrent lookups of the same place, from any thread, share one request.
+    """
+
+    def __init__(self, path="geocode_cache.sqlite", geocode=osm_geocode, negative_ttl=24 * 3600,
+                 max_entries=100_000, rate_limit=1.0, max_workers=4):
+        self.geocode = geocode
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.rate_limiter = RateLimiter(rate_limit)
+        self.max_workers = max_workers
+        self.flights = SingleFlight()
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocodes ("
+            "key TEXT PRIMARY KEY, lat REAL, lng REAL, found INTEGER, created REAL, accessed REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS geocodes_accessed ON geocodes (accessed)")
+        self.conn.commit()
+        # Running count of the entries, so puts only count the table when it may be over capacity
+        (self.size,) = self.conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()
+
+    def get(self, place):
+        """Returns (hit, latlng) for a place; latlng is None for a cached negative result."""
+        hit, latlng = self._get(place)
+        METRICS.count("cache.requests", cache="geocode", result="hit" if hit else "miss")
+        return hit, latlng
+
+    def _get(self, place):
+        key = normalize_key(place)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT lat, lng, found, created FROM geocodes WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return False, None
+            lat, lng, found, created = row
+            if not found and now - created > self.negative_ttl:
+                return False, None
+            self.conn.execute("UPDATE geocodes SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+        return True, (lat, lng) if found else None
+
+    def put(self, place, latlng):
+        key = normalize_key(place)
+        now = time.time()
+        lat, lng = latlng if latlng is not None else (None, None)
+        with self.lock:
+            existed = self.conn.execute("SELECT 1 FROM geocodes WHERE key = ?", (key,)).fetchone() is not None
+            self.conn.execute(
+                "INSERT OR REPLACE INTO geocodes (key, lat, lng, found, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, lat, lng, int(latlng is not None), now, now),
+            )
+            self.size += not existed
+            if self.size > self.max_entries:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        # Other processes may share the file, so the table is counted before evicting; evicting a tenth of
+        # the capacity at once keeps the following puts from counting it again
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM geocodes").fetchone()
+        if count > self.max_entries:
+            excess = count - self.max_entries + self.max_entries // 10
+            self.conn.execute(
+                "DELETE FROM geocodes WHERE key IN (SELECT key FROM geocodes ORDER BY accessed LIMIT ?)", (excess,)
+            )
+            count -= excess
+        self.size = count
+
+    def _lookup(self, place):
+        # The previous flight for this key may have finished since the caller's lookup
+        hit, latlng = self._get(place)
+        if hit:
+            return latlng
+        try:
+            self.rate_limiter.wait()
+            with METRICS.span("geocode.request"):
+                latlng = self.geocode(place)
+        except Exception as e:
+            # Network errors are not cached, so the place is retried on the next request
+            print(e, " for place: ", place)
+            return None
+        self.put(place, latlng)
+        return latlng
+
+    def resolve(self, place):
+        """Returns (lat, lng) for a place, or None if it could not be geocoded."""
+        hit, latlng = self.get(place)
+        if hit:
+            return latlng
+        return self._resolve_miss(place)
+
+    def _resolve_miss(self, place):
+        # Concurrent misses of the same place share one lookup
+        return self.flights.do(normalize_key(place), lambda: self._lookup(place))
+
+    def resolve_many(self, places):
+        """Returns {place: (lat, lng)} for the places that could be geocoded.
+
+        Cache misses are looked up concurrently, sharing the rate limit, and each
+        distinct key is looked up only once.
+        """
+        places = list(places)
+        results = {}
+        misses = {}
+        for place in places:
+            hit, latlng = self.get(place)
+            if hit:
+                results[place] = latlng
+            else:
+                misses.setdefault(normalize_key(place), []).append(place)
+
+        if misses:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                # The cache was already looked up above, so misses are counted once
+                resolved = pool.map(self._resolve_miss, [names[0] for names in misses.values()])
+                for names, latlng in zip(misses.values(), resolved):
+                    for place in names:
+                        results[place] = latlng
+
+        return {place: results[place] for place in places if results.get(place) is not None}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# (connect, read) timeouts in seconds, so a slow upstream cannot hang a Streamlit worker
+DEFAULT_TIMEOUT = (5, 60)
+# Seconds a request may take across all its attempts and the waits between them
+DEFAULT_DEADLINE = 90
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses meaning the request was not processed, so even a non-idempotent one can be sent again
+UNPROCESSED_STATUSES = {429, 503}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+def backoff_delay(attempt, response=None, base=0.5, cap=10.0):
+    """Returns the delay before retry `attempt`: the server's Retry-After if given, else full-jitter backoff."""
+    if response is not None:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return min(float(retry_after), cap)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _not_sent(error):
+    """Returns True if the request failed before it reached the server, such as on a connect timeout."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def _clamp(timeout, remaining):
+    """Returns the timeout with its read part cut to the seconds left before the deadline."""
+    remaining = max(remaining, 0.001)
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return connect, remaining if read is None else min(read, remaining)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+class Transport:
+    """Shared HTTP client with pooled keep-alive connections, per-host limits, timeouts and retries.
+
+    Exposes `get`/`post`/`request` like a requests.Session, so it can be handed
+    to libraries that accept a session. Idempotent requests are retried on
+    connection errors, timeouts and 429/5xx responses. Others, such as POSTs,
+    are only retried when they did not reach the server or were answered 429
+    or 503, so a slow completion is never sent, and billed, twice; POSTs that
+    only read, such as Overpass queries, can pass `idempotent=True`. All the
+    attempts of a request and the waits between them fit in `deadline` seconds.
+    """
+
+    def __init__(self, pool_size=20, per_host_limit=4, timeout=DEFAULT_TIMEOUT, retries=3,
+                 deadline=DEFAULT_DEADLINE):
+        self.timeout = timeout
+        self.retries = retries
+        self.deadline = deadline
+        self.per_host_limit = per_host_limit
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.lock = threading.Lock()
+        self.host_limits = {}
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.host_limits:
+                self.host_limits[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self.host_limits[host]
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        timeout = kwargs.pop("timeout", self.timeout)
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES
+        deadline = time.monotonic() + self.deadline
+        limit = self._host_limit(url)
+        for attempt in range(self.retries + 1):
+            try:
+                with limit:
+                    response = self.session.request(method, url, timeout=_clamp(timeout, deadline - time.monotonic()),
+                                                    **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries or not (idempotent or _not_sent(e)):
+                    raise
+                delay = backoff_delay(attempt)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                time.sleep(delay)
+                continue
+            if response.status_code in retry_statuses and attempt < self.retries:
+                delay = backoff_delay(attempt, response)
+                if time.monotonic() + delay < deadline:
+                    time.sleep(delay)
+                    continue
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+# Shared by every outbound call in this process
+TRANSPORT = Transport()
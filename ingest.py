@@ -0,0 +1,225 @@
+"""Embeds places_greece.csv and the destination descriptions into the vector index main.py queries.
+
+Re-runs are incremental: every record's content hash, which covers the embedding
+model, is kept in a manifest, and only new or changed records are embedded and
+upserted. Records no longer in the sources are deleted from the index.
+
+    python ingest.py --csv places_greece.csv --backend local
+    python ingest.py --csv places_greece.csv --backend pinecone --batch-size 500 --concurrency 4
+"""
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+import pandas as pd
+
+from destinations import DESTINATIONS
+from local_vector_store import LocalVectorStore, fake_embed_batch
+from resources import load_creds
+from retrieval import openai_embed_batch
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_DIM = 1536
+PINECONE_UPSERT_SIZE = 100
+
+
+def place_records(csv_path, country, chunksize):
+    """Yields (id, text, metadata) for each place, reading the CSV in chunks."""
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        chunk = chunk.astype(object).where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False):
+            row = row._asdict()
+            name = row.get("place_name") or ""
+            address = row.get("place_address") or ""
+            types = row.get("has_type") or ""
+            id_ = str(row.get("place_id") or hashlib.sha1(f"{name}|{address}".encode("utf-8")).hexdigest())
+            text = f"{name}. {types}. {address}."
+            metadata = {
+                "type": "place",
+                "country": country,
+                "name": name,
+                "address": address,
+                "has_type": types,
+                "rating": row.get("rating"),
+                "latitude": row.get("latitude"),
+                "longitude": row.get("longitude"),
+                "text": text,
+            }
+            yield id_, text, {k: v for k, v in metadata.items() if v is not None}
+
+
+def destination_records():
+    """Yields (id, text, metadata) for each destination description."""
+    for destination in DESTINATIONS:
+        text = f"{destination['name']}: {destination['text']}"
+        metadata = {"type": "destination", "country": destination["country"], "name": destination["name"], "text": text}
+        yield f"destination:{destination['name']}", text, metadata
+
+
+def content_hash(text, metadata, embedding=""):
+    """Hashes a record with the embeddings it is indexed with, e.g. "text-embedding-ada-002:1536"."""
+    payload = json.dumps([text, metadata, embedding], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class Manifest:
+    """SQLite record of the content hash last indexed for each id."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS indexed (id TEXT PRIMARY KEY, hash TEXT)")
+
+    def unchanged(self, ids_and_hashes):
+        """Returns the ids whose stored hash matches."""
+        unchanged = set()
+        items = list(ids_and_hashes)
+        for start in range(0, len(items), 500):
+            part = dict(items[start:start + 500])
+            placeholders = ",".join("?" * len(part))
+            rows = self.conn.execute(f"SELECT id, hash FROM indexed WHERE id IN ({placeholders})", list(part))
+            unchanged.update(id_ for id_, hash_ in rows if part[id_] == hash_)
+        return unchanged
+
+    def ids(self):
+        return {id_ for id_, in self.conn.execute("SELECT id FROM indexed")}
+
+    def forget(self, ids, commit=True):
+        self.conn.executemany("DELETE FROM indexed WHERE id = ?", [(id_,) for id_ in ids])
+        if commit:
+            self.conn.commit()
+
+    def record(self, ids_and_hashes, commit=True):
+        self.conn.executemany("INSERT OR REPLACE INTO indexed (id, hash) VALUES (?, ?)", ids_and_hashes)
+        if commit:
+            self.conn.commit()
+
+    def commit(self):
+        self.conn.commit()
+
+
+def batched(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest(records, index, embed_batch, manifest, batch_size=256, concurrency=4, upsert_size=None,
+           durable_upserts=True, embedding=""):
+    """Embeds and upserts the new or changed records, returning counts of what was done.
+
+    Up to `concurrency` embedding requests of `batch_size` texts are in flight at once.
+    `embedding` names the embedding model and dimension, so records indexed with
+    other embeddings count as changed. `records` must cover every source: ids
+    indexed before but not among them are deleted from the index.
+    If upserts only become durable later (a local store that is saved at the end),
+    pass `durable_upserts=False` and commit the manifest after saving.
+    """
+    stats = {"seen": 0, "duplicates": 0, "skipped": 0, "indexed": 0, "deleted": 0}
+    seen = set()
+    start = time.perf_counter()
+
+    def changed_batches():
+        for batch in batched(records, batch_size):
+            stats["seen"] += len(batch)
+            fresh = []
+            for id_, text, metadata in batch:
+                if id_ in seen:
+                    stats["duplicates"] += 1
+                    continue
+                seen.add(id_)
+                fresh.append((id_, text, metadata, content_hash(text, metadata, embedding)))
+            unchanged = manifest.unchanged((r[0], r[3]) for r in fresh)
+            stats["skipped"] += len(unchanged)
+            changed = [r for r in fresh if r[0] not in unchanged]
+            if changed:
+                yield changed
+
+    def embed(batch):
+        return batch, embed_batch([text for _, text, _, _ in batch])
+
+    def upsert(batch, vectors):
+        items = [(id_, vector, metadata) for (id_, _, metadata, _), vector in zip(batch, vectors)]
+        step = upsert_size or len(items)
+        for i in range(0, len(items), step):
+            index.upsert(vectors=items[i:i + step])
+        manifest.record([(id_, hash_) for id_, _, _, hash_ in batch], commit=durable_upserts)
+        stats["indexed"] += len(batch)
+        elapsed = time.perf_counter() - start
+        print(f"seen {stats['seen']}, indexed {stats['indexed']}, skipped {stats['skipped']} "
+              f"({stats['seen'] / elapsed:.0f} rows/s, {stats['indexed'] / elapsed:.0f} embeddings/s)")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = []
+        for batch in changed_batches():
+            in_flight.append(pool.submit(embed, batch))
+            # Bound the number of outstanding requests, upserting in order as they complete
+            if len(in_flight) >= concurrency:
+                upsert(*in_flight.pop(0).result())
+        for future in in_flight:
+            upsert(*future.result())
+
+    removed = sorted(manifest.ids() - seen)
+    step = upsert_size or len(removed) or 1
+    for i in range(0, len(removed), step):
+        index.delete(ids=removed[i:i + step])
+    manifest.forget(removed, commit=durable_upserts)
+    stats["deleted"] = len(removed)
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", default="places_greece.csv")
+    parser.add_argument("--country", default="Greece", help="country of the places in the CSV")
+    parser.add_argument("--backend", choices=["local", "pinecone"], default="local")
+    parser.add_argument("--store", default="vector_store", help="directory of the local vector store")
+    parser.add_argument("--index-name", default="yourmyth-mvp")
+    parser.add_argument("--manifest", default=None, help="defaults to ingest_manifest_<backend>.sqlite")
+    parser.add_argument("--chunksize", type=int, default=10_000, help="CSV rows read at a time")
+    parser.add_argument("--batch-size", type=int, default=256, help="texts per embedding request")
+    parser.add_argument("--concurrency", type=int, default=4, help="embedding requests in flight")
+    parser.add_argument("--fake-embeddings", action="store_true", help="use offline hashed embeddings")
+    args = parser.parse_args()
+
+    if args.fake_embeddings:
+        embed_batch, model, dim = fake_embed_batch, "fake", 256
+    else:
+        openai.api_key = load_creds()["OPENAI_API_KEY"]
+        embed_batch, model, dim = openai_embed_batch, EMBEDDING_MODEL, EMBEDDING_DIM
+
+    if args.backend == "local":
+        index, upsert_size = LocalVectorStore.open(args.store, dim), None
+    else:
+        import pinecone
+
+        config = load_creds()
+        pinecone.init(api_key=config["PINECONE_API_KEY"], environment=config["PINECONE_API_ENV"])
+        index, upsert_size = pinecone.Index(args.index_name), PINECONE_UPSERT_SIZE
+
+    manifest = Manifest(args.manifest or f"ingest_manifest_{args.backend}.sqlite")
+    records = (r for source in (destination_records(), place_records(args.csv, args.country, args.chunksize))
+               for r in source)
+    local = args.backend == "local"
+    stats = ingest(records, index, embed_batch, manifest, args.batch_size, args.concurrency, upsert_size,
+                   durable_upserts=not local, embedding=f"{model}:{dim}")
+
+    if local:
+        index.save(args.store)
+        manifest.commit()
+    print(f"Done in {stats['seconds']:.1f} s: {stats['seen']} rows, {stats['indexed']} indexed, "
+          f"{stats['skipped']} unchanged, {stats['deleted']} deleted, {stats['duplicates']} duplicates.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import METRICS
+from resources import REGISTRY
+
+# Seconds a job waits before calling upstream, so inputs still being changed supersede it for free
+DEBOUNCE_SECONDS = 0.4
+# Seconds between two looks at a running job from the script thread
+POLL_SECONDS = 0.1
+# Worker threads per kind of job, shared by the jobs of that kind of every session in the process; jobs
+# mostly wait on upstream calls, whose concurrency the OpenAI scheduler bounds
+JOB_WORKERS = 32
+
+_current = threading.local()
+
+
+class JobCancelled(Exception):
+    """Raised in a job whose inputs were superseded before it finished."""
+
+
+def cancelled():
+    """Returns True if the job running on this thread has been superseded."""
+    job = getattr(_current, "job", None)
+    return job is not None and job.cancelled.is_set()
+
+
+def checkpoint():
+    """Raises JobCancelled if the job running on this thread has been superseded.
+
+    Jobs call it between stages, so a stale job stops before its next upstream call.
+    """
+    if cancelled():
+        raise JobCancelled(_current.job.name)
+
+
+class ProgressSlot:
+    """Stand-in for a Streamlit placeholder inside a job: it keeps the latest value written.
+
+    Jobs stream into slots instead of placeholders, and the script thread renders
+    them while it polls, so worker threads never write to a page that has moved on.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+        self.version = 0
+
+    def markdown(self, body):
+        with self.lock:
+            self.value = body
+            self.version += 1
+
+    write = markdown
+
+    def read(self):
+        with self.lock:
+            return self.version, self.value
+
+
+class Job:
+    """One run of a function for a set of inputs, identified by `key`."""
+
+    def __init__(self, name, key):
+        self.name = name
+        self.key = key
+        self.cancelled = threading.Event()
+        # Resolved by the worker; cancelled outright if the job is superseded before it starts
+        self.future = Future()
+        self.timer = None
+        self.slots = {}
+        self.lock = threading.Lock()
+
+    def slot(self, name):
+        with self.lock:
+            if name not in self.slots:
+                self.slots[name] = ProgressSlot()
+            return self.slots[name]
+
+    def done(self):
+        return self.future.done()
+
+    def failed(self):
+        return self.future.done() and (self.future.cancelled() or self.future.exception() is not None)
+
+    def result(self):
+        return self.future.result()
+
+
+def shared_pool(name):
+    """Returns the worker pool shared by the jobs named `name` of every session.
+
+    Each kind of job has its own pool, so short map jobs never queue behind
+    itineraries waiting on the model.
+    """
+    return REGISTRY.get(f"jobs.pool.{name}",
+                        lambda: ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix=f"job-{name}"),
+                        uses_creds=False)
+
+
+def _chain(source, target):
+    """Copies the outcome of the worker's future to the job's."""
+    if source.cancelled():
+        target.set_exception(JobCancelled())
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class JobManager:
+    """Latest job of each kind for one session, run on the pool shared by that kind.
+
+    A job is handed to the pool only after its debounce delay, which is spent
+    on a timer rather than on a worker. Submitting new inputs for a kind
+    supersedes the job for the previous ones: if it is still in its debounce
+    delay it ends without calling upstream or taking a worker, and otherwise
+    its result is ignored and it stops at its next `checkpoint`.
+    Submitting the same inputs again returns the running or finished job, so
+    reruns caused by other widgets do not repeat the work.
+
+    `capture` is called on the submitting thread and its result passed to
+    `attach` on the worker thread, to carry the Streamlit script context over.
+    """
+
+    def __init__(self, pool=None, debounce=DEBOUNCE_SECONDS, capture=None, attach=None):
+        # None: each kind of job runs on its shared_pool
+        self.pool = pool
+        self.debounce = debounce
+        self.capture = capture
+        self.attach = attach
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def submit(self, name, key, fn, debounce=None):
+        """Returns the job running `fn(job)` for `key`, starting it unless it is already running or done."""
+        with self.lock:
+            current = self.jobs.get(name)
+            if current is not None and current.key == key and not current.failed():
+                return current
+            if current is not None and not current.done():
+                self._cancel(current)
+                METRICS.count("jobs.superseded", job=name)
+            job = Job(name, key)
+            context = self.capture() if self.capture is not None else None
+            debounce = self.debounce if debounce is None else debounce
+            if debounce > 0:
+                job.timer = threading.Timer(debounce, self._start, (job, fn, context))
+                job.timer.daemon = True
+                job.timer.start()
+            else:
+                self._start(job, fn, context)
+            self.jobs[name] = job
+        METRICS.count("jobs.submitted", job=name)
+        return job
+
+    @staticmethod
+    def _cancel(job):
+        job.cancelled.set()
+        if job.timer is not None:
+            job.timer.cancel()
+        if job.future.cancel():
+            # Superseded during its debounce delay: no upstream call was made
+            METRICS.count("jobs.cancelled", job=job.name)
+
+    def _start(self, job, fn, context):
+        """Hands the job to its pool once its debounce delay is over, unless it was superseded meanwhile."""
+        if not job.future.set_running_or_notify_cancel():
+            return
+        pool = self.pool or shared_pool(job.name)
+        pool.submit(self._run, job, fn, context).add_done_callback(lambda f: _chain(f, job.future))
+
+    def _run(self, job, fn, context):
+        if self.attach is not None:
+            self.attach(context)
+        if job.cancelled.is_set():
+            # Superseded while queued for a worker
+            METRICS.count("jobs.stopped", job=job.name)
+            raise JobCancelled(job.name)
+        _current.job = job
+        start = time.perf_counter()
+        try:
+            return fn(job)
+        except JobCancelled:
+            # Superseded while running: stopped at a checkpoint
+            METRICS.count("jobs.stopped", job=job.name)
+            raise
+        except Exception:
+            METRICS.count("job.errors", job=job.name)
+            raise
+        finally:
+            _current.job = None
+            METRICS.observe("job", time.perf_counter() - start, job=job.name)
+
+    def cancel_all(self):
+        """Supersedes every job of the session, such as when its inputs are cleared."""
+        with self.lock:
+            for job in self.jobs.values():
+                self._cancel(job)
+            self.jobs.clear()
+
+
+def poll(job, placeholders=None, status=None, interval=POLL_SECONDS):
+    """Waits for a job on the script thread and returns its result, rendering its slots as they change.
+
+    `placeholders` maps slot names to Streamlit placeholders. `status` is
+    updated on every tick; each update lets Streamlit stop the wait as soon as
+    the user changes an input, so the page never blocks on a superseded job.
+    """
+    placeholders = placeholders or {}
+    rendered = {}
+    start = time.perf_counter()
+    while True:
+        done = job.done()
+        for name, placeholder in placeholders.items():
+            version, value = job.slot(name).read()
+            if value is not None and rendered.get(name) != version:
+                placeholder.markdown(value)
+                rendered[name] = version
+        if done:
+            break
+        if status is not None:
+            status.caption(f"Working... {time.perf_counter() - start:.1f}s")
+        time.sleep(interval)
+    if status is not None:
+        status.empty()
+    return job.result()
+
+
+def session_jobs(key="jobs"):
+    """Returns the JobManager of the current Streamlit session, creating it on first use."""
+    import streamlit as st
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+    if key not in st.session_state:
+        st.session_state[key] = JobManager(
+            capture=get_script_run_ctx, attach=lambda ctx: add_script_run_ctx(threading.current_thread(), ctx))
+    return st.session_state[key]
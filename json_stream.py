@@ -0,0 +1,131 @@
+import json
+import re
+
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class IncrementalJSONParser:
+    """Scans JSON text chunk by chunk as an LLM streams it.
+
+    Every string value is reported to `on_string(path, value)` as soon as its
+    closing quote arrives, where `path` lists the keys (or None for array items)
+    of the containers it sits in. The parser also remembers the last point where
+    the text could be cut and closed into valid JSON, which `recover` uses to
+    salvage malformed or truncated output. Text before the first bracket, such
+    as a chatty preamble, is skipped.
+    """
+
+    def __init__(self, on_string=None):
+        self.on_string = on_string
+        self.text = []
+        self.pos = 0
+        self.start = None
+        self.done = False
+        # Each frame is [opening bracket, key in parent, current key, expecting a key]
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+        self.string_chars = []
+        self.safe_end = None
+        self.safe_closers = ""
+
+    def _mark_safe(self, end):
+        self.safe_end = end
+        self.safe_closers = "".join(CLOSERS[frame[0]] for frame in reversed(self.stack))
+
+    def _end_string(self):
+        raw = "".join(self.string_chars)
+        try:
+            value = json.loads('"' + raw + '"')
+        except ValueError:
+            value = raw
+        frame = self.stack[-1]
+        if frame[0] == "{" and frame[3]:
+            frame[2] = value
+            frame[3] = False
+            return
+        self._mark_safe(self.pos + 1)
+        if self.on_string:
+            path = [f[1] for f in self.stack[1:]] + [frame[2] if frame[0] == "{" else None]
+            self.on_string(path, value)
+
+    def feed(self, chunk):
+        """Consumes the next chunk of text."""
+        self.text.append(chunk)
+        for char in chunk:
+            if self.done:
+                break
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                    self.string_chars.append(char)
+                elif char == "\\":
+                    self.escaped = True
+                    self.string_chars.append(char)
+                elif char == '"':
+                    self.in_string = False
+                    self._end_string()
+                else:
+                    self.string_chars.append(char)
+            elif self.start is None:
+                if char in CLOSERS:
+                    self.start = self.pos
+                    self.stack.append([char, None, None, char == "{"])
+                    self._mark_safe(self.pos + 1)
+            elif char == '"':
+                self.in_string = True
+                self.string_chars = []
+            elif char in CLOSERS:
+                parent = self.stack[-1]
+                key = parent[2] if parent[0] == "{" else None
+                self.stack.append([char, key, None, char == "{"])
+                self._mark_safe(self.pos + 1)
+            elif char in "}]":
+                self.stack.pop()
+                if not self.stack:
+                    self.done = True
+                self._mark_safe(self.pos + 1)
+            elif char == ",":
+                self._mark_safe(self.pos)
+                if self.stack[-1][0] == "{":
+                    self.stack[-1][3] = True
+            self.pos += 1
+
+    def recover(self):
+        """Returns the parsed JSON, closing or trimming malformed or truncated output.
+
+        Raises ValueError if nothing usable was received.
+        """
+        text = "".join(self.text)
+        if self.start is None:
+            raise ValueError("No JSON found in the response")
+        try:
+            value, _ = json.JSONDecoder().raw_decode(text, self.start)
+            return value
+        except ValueError:
+            pass
+        candidate = text[self.start:self.safe_end] + self.safe_closers
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            # Last resort for the most common model slip: trailing commas before a closing bracket
+            return json.loads(re.sub(r",\s*(?=[}\]])", "", candidate))
+
+
+def recover_json(text):
+    """Parses JSON text, salvaging as much as possible from malformed or truncated output."""
+    parser = IncrementalJSONParser()
+    parser.feed(text)
+    return parser.recover()
+
+
+class ItineraryPlacesParser(IncrementalJSONParser):
+    """Emits `on_place(day, place)` for each itinerary[day]["places"] entry as soon as it is complete."""
+
+    def __init__(self, on_place):
+        super().__init__(on_string=self._on_string)
+        self.on_place = on_place
+
+    def _on_string(self, path, value):
+        if len(path) >= 3 and path[-2] == "places" and path[-1] is None:
+            self.on_place(path[-3], value)
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from metrics import METRICS
+from resources import get_encoding_for_model
+from scheduler import completion_budget, shared_scheduler
+from single_flight import SingleFlight
+
+
+def make_key(model, prompt, params):
+    """Returns the exact-match cache key for a completion request."""
+    payload = json.dumps([model, prompt, sorted(params.items())], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def scheduled_completion(model, prompt, create, params, scheduler=None):
+    """Calls `create()` once the scheduler lets the request for `prompt` through, and counts its tokens.
+
+    `scheduler` defaults to the one configured in creds.yaml.
+    """
+    encoding = get_encoding_for_model(model)
+    prompt_tokens = len(encoding.encode(prompt))
+    scheduler = scheduler or shared_scheduler()
+    # The completion's share of the estimate is given back once its real length is known
+    with METRICS.span("llm.completion", model=model):
+        value = scheduler.run(
+            prompt_tokens + completion_budget(params), create,
+            count_tokens=lambda v: prompt_tokens + (len(encoding.encode(v)) if isinstance(v, str) else 0))
+    if isinstance(value, str):
+        METRICS.tokens(model, encoding, prompt, value)
+    return value
+
+
+class CompletionCache:
+    """Size-bounded, process-wide cache of LLM completions.
+
+    The exact tier is keyed on (model, rendered prompt, sampling params). If an
+    `embed` function is given, deterministic requests (temperature 0) that miss the
+    exact tier are also matched against previous prompts for the same model and
+    params by cosine similarity, and reused above `similarity_threshold`.
+    Both tiers evict the least recently used entry beyond `max_entries`.
+    Only deterministic requests are cached: sampled ones (temperature above 0)
+    are sent upstream every time, like those whose result depends on live data.
+    Concurrent misses for the same request share a single upstream call, which
+    waits for its turn in `scheduler` (by default the one configured in creds.yaml).
+    """
+
+    def __init__(self, max_entries=1024, embed=None, similarity_threshold=0.97, scheduler=None):
+        self.max_entries = max_entries
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # Semantic tier: key -> (signature, unit vector, completion)
+        self.vectors = OrderedDict()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.flights = SingleFlight()
+        self.scheduler = scheduler
+
+    def _signature(self, model, params):
+        return make_key(model, "", params)
+
+    def _embed(self, prompt):
+        vector = np.asarray(self.embed(prompt), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _semantic_lookup(self, signature, vector):
+        candidates = [(value, v) for s, v, value in self.vectors.values() if s == signature]
+        if not candidates:
+            return None
+        scores = np.stack([v for _, v in candidates]) @ vector
+        best = int(np.argmax(scores))
+        if scores[best] >= self.similarity_threshold:
+            return candidates[best][0]
+        return None
+
+    @staticmethod
+    def cacheable(params):
+        """Returns True for deterministic requests, whose completion can be reused."""
+        return params.get("temperature", 0) == 0
+
+    def _semantic_enabled(self, params):
+        return self.embed is not None and self.cacheable(params)
+
+    def get(self, model, prompt, **params):
+        """Returns the cached completion for the request, or None on a miss."""
+        key = make_key(model, prompt, params)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                METRICS.count("cache.requests", cache="completion", result="hit")
+                return self.entries[key]
+
+        if self._semantic_enabled(params):
+            vector = self._embed(prompt)
+            with self.lock:
+                value = self._semantic_lookup(self._signature(model, params), vector)
+                if value is not None:
+                    self.semantic_hits += 1
+                    METRICS.count("cache.requests", cache="completion", result="semantic_hit")
+                    return value
+
+        with self.lock:
+            self.misses += 1
+        METRICS.count("cache.requests", cache="completion", result="miss")
+        return None
+
+    def put(self, model, prompt, value, **params):
+        key = make_key(model, prompt, params)
+        vector = self._embed(prompt) if self._semantic_enabled(params) else None
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            if vector is not None:
+                self.vectors[key] = (self._signature(model, params), vector, value)
+                self.vectors.move_to_end(key)
+                while len(self.vectors) > self.max_entries:
+                    self.vectors.popitem(last=False)
+
+    def get_or_create(self, model, prompt, create, **params):
+        """Returns the cached completion, calling `create()` and caching its result on a miss.
+
+        If the same request is already being created (e.g. by another session),
+        this waits for that call instead of making another one. Requests that are
+        not `cacheable` always call `create()`.
+        """
+        if not self.cacheable(params):
+            METRICS.count("cache.requests", cache="completion", result="bypass")
+            return self._create(model, prompt, create, params)
+        value = self.get(model, prompt, **params)
+        if value is not None:
+            return value
+        key = make_key(model, prompt, params)
+
+        def create_once():
+            # The previous flight for this key may have finished since the lookup above
+            with self.lock:
+                if key in self.entries:
+                    return self.entries[key]
+            value = self._create(model, prompt, create, params)
+            self.put(model, prompt, value, **params)
+            return value
+
+        return self.flights.do(key, create_once)
+
+    def _create(self, model, prompt, create, params):
+        return scheduled_completion(model, prompt, create, params, self.scheduler)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.semantic_hits + self.misses
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / total if total else 0.0,
+                "size": len(self.entries),
+                "coalesced": self.flights.shared,
+            }
+
+
+def llm_params(llm):
+    """Returns the sampling params of a LangChain OpenAI LLM that affect its output."""
+    return {
+        "temperature": llm.temperature,
+        "max_tokens": llm.max_tokens,
+        "top_p": llm.top_p,
+        "frequency_penalty": llm.frequency_penalty,
+        "presence_penalty": llm.presence_penalty,
+    }
+
+
+def cached_predict(cache, chain, callbacks=None, **inputs):
+    """Runs `chain.predict(**inputs)` for an LLMChain through the completion cache."""
+    prompt = chain.prompt.format(**{k: inputs[k] for k in chain.prompt.input_variables})
+    return cache.get_or_create(
+        chain.llm.model_name, prompt, lambda: chain.predict(callbacks=callbacks, **inputs), **llm_params(chain.llm)
+    )
+
+
+def scheduled_predict(chain, callbacks=None, **inputs):
+    """Runs `chain.predict(**inputs)` for an LLMChain through the OpenAI scheduler, without caching it."""
+    prompt = chain.prompt.format(**{k: inputs[k] for k in chain.prompt.input_variables})
+    return scheduled_completion(chain.llm.model_name, prompt, lambda: chain.predict(callbacks=callbacks, **inputs),
+                                llm_params(chain.llm))
+
+
+# Shared by every app running in this process
+COMPLETION_CACHE = CompletionCache()
+METRICS.gauge("cache.hit_rate", lambda: COMPLETION_CACHE.stats()["hit_rate"], cache="completion")
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+
+
+def fake_embed_batch(texts, dim=256):
+    """Deterministic bag-of-hashed-words embeddings, for running retrieval offline."""
+    vectors = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in re.findall(r"\w+", text.casefold()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            vectors[row, int.from_bytes(digest[:4], "little") % dim] += 1.0 if digest[4] & 1 else -1.0
+    return vectors.tolist()
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class LocalVectorStore:
+    """In-process vector index with the query/upsert interface of a pinecone.Index.
+
+    Vectors are kept L2-normalized in one float32 matrix, so cosine similarity is
+    a single matrix-vector product. Metadata filters use pinecone's syntax for
+    equality ({"country": "Greece"}, {"country": {"$eq": ...}} or {"$in": [...]})
+    and are answered from a per-field posting index. An optional IVF index
+    (k-means coarse quantizer) restricts the search to the `nprobe` nearest lists
+    for large stores. Stores saved with `save` can be loaded memory-mapped, so
+    several processes share the same pages; the first upsert copies them.
+    """
+
+    def __init__(self, dim, vectors=None, ids=None, metadata=None):
+        self.dim = dim
+        self.vectors = vectors if vectors is not None else np.zeros((0, dim), dtype=np.float32)
+        self.ids = list(ids or [])
+        self.metadata = list(metadata or [])
+        self.positions = {id_: row for row, id_ in enumerate(self.ids)}
+        self.lock = threading.RLock()
+        self.field_rows = {}
+        self.centroids = None
+        self.ivf_lists = None
+        self.nprobe = 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def upsert(self, vectors):
+        """Inserts or replaces (id, values, metadata) tuples, like pinecone.Index.upsert."""
+        vectors = list(vectors)
+        if not vectors:
+            return {"upserted_count": 0}
+        ids = [v[0] for v in vectors]
+        values = _normalize([v[1] for v in vectors])
+        metadata = [dict(v[2]) if len(v) > 2 and v[2] else {} for v in vectors]
+        with self.lock:
+            # A memory-mapped matrix is read-only, so copy it before the first write
+            matrix = self.vectors if self.vectors.flags.writeable else np.array(self.vectors, dtype=np.float32)
+            new_rows = []
+            for id_, value, meta in zip(ids, values, metadata):
+                if id_ in self.positions:
+                    row = self.positions[id_]
+                    matrix[row] = value
+                    self.metadata[row] = meta
+                else:
+                    self.positions[id_] = len(self.ids) + len(new_rows)
+                    new_rows.append(value)
+                    self.ids.append(id_)
+                    self.metadata.append(meta)
+            if new_rows:
+                matrix = np.vstack([matrix, np.stack(new_rows)])
+            self.vectors = matrix
+            self.field_rows = {}
+            if self.centroids is not None:
+                self.ivf_lists = self._assign(matrix)
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids):
+        """Removes the vectors with the given ids, like pinecone.Index.delete(ids=...)."""
+        with self.lock:
+            removed = {self.positions[id_] for id_ in ids if id_ in self.positions}
+            if not removed:
+                return {}
+            keep = np.asarray([row for row in range(len(self.ids)) if row not in removed], dtype=np.int64)
+            self.vectors = np.asarray(self.vectors, dtype=np.float32)[keep] if len(keep) else \
+                np.zeros((0, self.dim), dtype=np.float32)
+            self.ids = [self.ids[row] for row in keep]
+            self.metadata = [self.metadata[row] for row in keep]
+            self.positions = {id_: row for row, id_ in enumerate(self.ids)}
+            self.field_rows = {}
+            if self.centroids is not None:
+                self.ivf_lists = self._assign(self.vectors)
+        return {}
+
+    def _rows_for(self, key, value):
+        if (key, value) not in self.field_rows:
+            rows = [row for row, meta in enumerate(self.metadata) if meta.get(key) == value]
+            self.field_rows[(key, value)] = np.asarray(rows, dtype=np.int64)
+        return self.field_rows[(key, value)]
+
+    def _filter_rows(self, filter):
+        rows = None
+        for key, condition in filter.items():
+            if isinstance(condition, dict) and "$in" in condition:
+                values = condition["$in"]
+            elif isinstance(condition, dict) and "$eq" in condition:
+                values = [condition["$eq"]]
+            elif isinstance(condition, dict):
+                raise ValueError(f"Unsupported filter operator for {key}: {condition}")
+            else:
+                values = [condition]
+            matched = np.unique(np.concatenate([self._rows_for(key, v) for v in values] + [np.empty(0, np.int64)]))
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        return rows
+
+    def build_ivf(self, n_lists=None, iterations=10, nprobe=4, seed=0):
+        """Clusters the vectors with k-means so queries only scan the nearest `nprobe` lists."""
+        with self.lock:
+            n = len(self.ids)
+            n_lists = n_lists or max(1, int(np.sqrt(n)))
+            rng = np.random.default_rng(seed)
+            centroids = self.vectors[rng.choice(n, size=min(n_lists, n), replace=False)].copy()
+            for _ in range(iterations):
+                assignments = np.argmax(self.vectors @ centroids.T, axis=1)
+                for c in range(len(centroids)):
+                    members = self.vectors[assignments == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = _normalize(centroids)
+            self.centroids = centroids
+            self.nprobe = nprobe
+            self.ivf_lists = self._assign(self.vectors)
+
+    def _assign(self, vectors):
+        # Inverted lists: the sorted rows of each cluster
+        assignments = np.argmax(vectors @ self.centroids.T, axis=1)
+        return [np.flatnonzero(assignments == c) for c in range(len(self.centroids))]
+
+    def _candidate_rows(self, vector, filter):
+        rows = self._filter_rows(filter) if filter else None
+        if self.centroids is not None:
+            lists = np.argsort(self.centroids @ vector)[::-1][:self.nprobe]
+            in_lists = np.sort(np.concatenate([self.ivf_lists[c] for c in lists]))
+            rows = in_lists if rows is None else np.intersect1d(rows, in_lists, assume_unique=True)
+        return rows
+
+    def _query_one(self, vector, top_k, include_metadata, filter):
+        rows = self._candidate_rows(vector, filter)
+        matrix = self.vectors if rows is None else self.vectors[rows]
+        scores = matrix @ vector
+        k = min(top_k, len(scores))
+        if k == 0:
+            return {"matches": []}
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        matches = []
+        for i in best:
+            row = int(i if rows is None else rows[i])
+            match = {"id": self.ids[row], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = self.metadata[row]
+            matches.append(match)
+        return {"matches": matches}
+
+    def query(self, vector=None, queries=None, top_k=5, include_metadata=False, filter=None, **kwargs):
+        """Returns the top_k matches for one vector, or {"results": [...]} for several queries."""
+        with self.lock:
+            if queries is not None:
+                queries = _normalize(queries)
+                return {"results": [self._query_one(q, top_k, include_metadata, filter) for q in queries]}
+            return self._query_one(_normalize(vector), top_k, include_metadata, filter)
+
+    def save(self, directory):
+        """Writes the store to a directory: vectors.npy plus ids and metadata as JSON."""
+        os.makedirs(directory, exist_ok=True)
+        with self.lock:
+            # Write new files and swap them in, since the current vectors may be mapped from the old ones
+            vectors_path = os.path.join(directory, "vectors.npy")
+            with open(vectors_path + ".tmp", "wb") as f:
+                np.save(f, np.asarray(self.vectors, dtype=np.float32))
+            records_path = os.path.join(directory, "records.json")
+            with open(records_path + ".tmp", "w") as f:
+                json.dump({"dim": self.dim, "ids": self.ids, "metadata": self.metadata}, f)
+            os.replace(vectors_path + ".tmp", vectors_path)
+            os.replace(records_path + ".tmp", records_path)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Loads a saved store, memory-mapping the vectors unless `mmap` is False."""
+        with open(os.path.join(directory, "records.json")) as f:
+            records = json.load(f)
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r" if mmap else None)
+        return cls(records["dim"], vectors, records["ids"], records["metadata"])
+
+    @classmethod
+    def open(cls, directory, dim):
+        """Loads the store saved in `directory`, or returns an empty one if there is none yet.
+
+        A saved store of another dimension was built with other embeddings, so an
+        empty one replaces it.
+        """
+        if os.path.exists(os.path.join(directory, "records.json")):
+            store = cls.load(directory)
+            if store.dim == dim:
+                return store
+        return cls(dim)
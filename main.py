@@ -1,28 +1,65 @@
+import json
 import streamlit as st
 from langchain import PromptTemplate
 from langchain.llms import OpenAI
 from langchain.vectorstores import Chroma, Pinecone
-from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.chains.question_answering import load_qa_chain
 import openai
 import pinecone
-import yaml
+from resources import REGISTRY, get_encoding_for_model, load_creds
+from destinations import COUNTRY_LOCATIONS, DESTINATIONS
+from prompt_assembly import PromptAssembler, format_examples, format_report, select_examples
+from streaming import StreamlitTokenHandler
+from local_vector_store import LocalVectorStore
+from retrieval import QueryEmbedder, RetrievalBatcher, Retriever
+from llm_cache import COMPLETION_CACHE, llm_params
+from single_flight import SingleFlight
+from metrics import configure, sidebar_panel
+from jobs import poll, session_jobs
+from scheduler import SchedulerSaturated
 
 # Load the YAML file into a dictionary
-with open("creds.yaml", "r") as f:
-    config = yaml.safe_load(f)
+config = load_creds()
 
-openai_api_key = config['OPENAI_API_KEY']
-embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-pinecone.init(
-    api_key=config['PINECONE_API_KEY'],  # find at app.pinecone.io
-    environment=config['PINECONE_API_ENV']  # next to api key in console
-)
+# Start the metrics exporters enabled in creds.yaml
+configure(config)
 
+openai_api_key = config['OPENAI_API_KEY']
+# Query embeddings are requested with the openai client directly
+openai.api_key = openai_api_key
 index_name = "yourmyth-mvp"
-index = pinecone.Index(index_name)
-pinecone_docs = Pinecone.from_existing_index(index_name,embedding=embeddings)
+# Set VECTOR_BACKEND: local in creds.yaml to retrieve from the local vector store instead of Pinecone
+use_local_index = config.get('VECTOR_BACKEND', 'pinecone') == 'local'
 
+def build_pinecone(config):
+    pinecone.init(
+        api_key=config['PINECONE_API_KEY'],  # find at app.pinecone.io
+        environment=config['PINECONE_API_ENV']  # next to api key in console
+    )
+    return pinecone.Index(index_name)
+
+def build_qa_chain(config):
+    # Tokens are streamed to the callbacks passed with each run
+    llm = OpenAI(temperature=0, openai_api_key=config['OPENAI_API_KEY'], streaming=True)
+    return load_qa_chain(llm, chain_type="stuff", prompt=qa_prompt)
+
+def build_local_index(config):
+    # Local in-process alternative to Pinecone, memory-mapped from disk
+    return LocalVectorStore.load(config.get('LOCAL_VECTOR_STORE', 'vector_store'))
+
+def build_retrieval(config):
+    # Queries from concurrent sessions are embedded and looked up together
+    if use_local_index:
+        index = REGISTRY.get("main.local_index", build_local_index)
+    else:
+        index = REGISTRY.get("main.pinecone", build_pinecone)
+    return RetrievalBatcher(Retriever(index, QueryEmbedder(), top_k=5))
+
+# Built once per process and shared by all sessions, rebuilt when creds.yaml changes
+retrieval = REGISTRY.get("main.retrieval", build_retrieval)
+
+# The static instructions come first and are identical in every request, so providers can cache them;
+# the examples are selected per request and the user's fields come last
 template = """
     Below is a user input for a desired travel recommendation.
 
@@ -37,49 +74,56 @@ template = """
     - Cultural: Art galleries, museums, churches, amphitheatre, ancient ruins, temples, castles, palaces
     - Nightlife: Bars, clubs, pubs, live music, dancing
     - Food: Burger, pasta, pizza, greek salad, seafood 
-
-    Here are some examples of locations depending on the country:
-
-    - Italy: Palermo, Catania, Taormina, Syracuse, Agrigento, Ragusa, Cefalù, Aeolian Islands, Lipari, Stromboli, Panarea, Vulcano, Salina, Filicudi, Alicudi, Favignana, Pantelleria, Lampedusa, Ustica, San Vito Lo Capo, Scopello, Trapani, Marsala, Erice, Selinunte, Segesta, Monreale, Noto, Modica, Piazza Armerina, Enna, Messina, Milazzo, Tindari, Etna, Alcantara Gorges, Nebrodi Mountains, Naples
-    - Greece: Amorgos, Rhodes, Santorini, Agathonisi, Chalki, Leros, Ikaria, Samothrace, Thasos, Agios Nikolaos, Skiathos, Zakynthos, Corfu, Nafplio, Spetses, Kilkis, Prespes, Lefkada, Volos, Mani, Elafonisos, Kythera
-    - Spain: Barcelona, Malaga, Bilbao, Tenerife, Valencia, Madrid, Ibiza, Majorca, Menorca, Lanzarote, La Palma, La Gomera, El Hierro
-
-    Here are examples of recommendations:
-    - Amorgos: Amorgos is a paradise for explorers, divers, and hikers. Its small bays, mountain paths and all-white churches, make it the ideal destination for an alternative Cycladic holiday. You should visit Ammos AMORGOS, a beach bar with a great view of the sea and the sunset. 
-    - Catania: Catania in Sicily has a long history in a picturesque scene. With Aetna on its backdrop it offers a lot to lovers of Nature. Moreover, it's on the water and has beautiful beaches with turquoise waters. Visit Villa Bellini, a beautiful park in the heart of the city.
-    - Samothrace: Samothrace in the north east Aegean is famed for its wild mountain, Saos, that towers on the island and attracts travelers who prefer alternative types of tourism beyond the standard Greek island beach vibes (which if you wish, you can also indulge in here). Mount Saos is the highest mountain in the Aegean and its gorges, forests and waterfalls make for great exploring and action. Its peak, called Fegari (Moon), is at an impressive and panoramic height of 1.611 metres (5,285ft) and according to Homer, is where Poseidon watched the Achaeans, led by King Agamemnon, besiege Troy.
-    - Epidaurus: Ancient Epidaurus is a must for lovers of culture. Not just one of the most significant archaeological sites in Greece, but also a place that has managed to become a travel destination by preserving its ancient identity, keeping its theatre in operation, and hosting dozens of shows each year.
-    - Paros: Paros has a healthy art scene with numerous galleries and public spaces given over to exhibitions. Paros Park hosts a series of summer events, such as concerts in the amphitheatre and films under the stars at Cine Enastron. Also in summer, a week never seems to pass without some celebration or feast day. 
-    - Samos: Experience Samos and its vibrant nightlife, a North Aegean Island in Greece. An array of bars caters to diverse tastes. From sophisticated artistic soirees to lively waterfront dance parties and themed nights, Samos offers a unique blend of ambiance and entertainment. In Iera Odos, an establishment exuding class, you’ll find erudite crowds drawn to its intellectual ambiance, artistic events, and live music. 
-    - Mykonos: Mykonos is perhaps the epicenter of nightlife in Greece and for a good reason. Savor a selection of Mykonos’s finest Greek wines during a wine-tasting tour. Visit the island’s most famous beaches, including Super Paradise, Paradise, and Paraga.
-
+{examples}
     Please start with a summary of the user's input for {country} followed by recommendations.
     COUNTRY:{country}
     
     YOUR {recommendations} RESPONSE:
 """
 
-prompt = PromptTemplate(
-    input_variables=["country","recommendations"],
-    template=template,
+# The stuff chain's default prompt starts with the retrieved {context}; this one keeps the static instructions
+# first, then the context, then the examples and the user's fields as the question
+qa_prompt = PromptTemplate(
+    input_variables=["context", "question"],
+    template=template.split("{examples}")[0]
+    + "\n    Use the following information about places where it is relevant:\n\n{context}\n{question}",
 )
 
-def load_LLM(query, docs):
-    """Logic for loading the chain you want to use should go here."""
-    # Make sure your openai_api_key is set as an environment variable
-    llm = OpenAI(temperature=0, openai_api_key=openai_api_key)
-    chain = load_qa_chain(llm, chain_type="stuff")
-    # vectored_query = gpt3_embedding(query)
-    # docs = docs.similarity_search(query, k=5, include_metadata=True)
-    res = openai.Embedding.create(input=[query],engine=embed_model)
+def render_examples(countries, destinations):
+    locations = "\n".join(f"    - {c}: {COUNTRY_LOCATIONS[c]}" for c in countries if c in COUNTRY_LOCATIONS)
+    text = ""
+    if locations:
+        text += f"\n    Here are some examples of locations depending on the country:\n\n{locations}\n"
+    return text + f"\n    Here are examples of recommendations:\n{format_examples(destinations)}\n\n"
 
-    # retrieve from Pinecone
-    xq = res['data'][0]['embedding']
+def build_assembler():
+    # Savings are measured against the examples for every country that the template used to include
+    return PromptAssembler(get_encoding_for_model("text-davinci-003"), template,
+                           render_examples(COUNTRY_LOCATIONS, DESTINATIONS))
 
-    # get relevant contexts (including the questions)
-    res = index.query(xq, top_k=5, include_metadata=True)
-    results = chain.run(input_documents=docs, question=query)
-    return results
+def load_LLM(query, retrieval_query, retrieval, handler=None, filter=None):
+    """Logic for loading the chain you want to use should go here."""
+    # Make sure your openai_api_key is set as an environment variable
+    chain = REGISTRY.get("main.qa_chain", build_qa_chain)
+    llm = chain.llm_chain.llm
+
+    def answer():
+        # get relevant contexts from Pinecone: the query is embedded once (or served from
+        # the embedding cache) and batched with queries from other sessions
+        docs = retrieval.retrieve(retrieval_query, filter)
+
+        # The retrieved contexts are part of the prompt, so they are part of the cache key
+        rendered = chain.llm_chain.prompt.format(
+            context="\n\n".join(doc.page_content for doc in docs), question=query)
+        return COMPLETION_CACHE.get_or_create(
+            llm.model_name, rendered,
+            lambda: chain.run(input_documents=docs, question=query, callbacks=[handler] if handler else None),
+            **llm_params(llm))
+
+    # Sessions asking the same question at the same time share one retrieval and completion;
+    # only the first one streams, the others receive the finished answer
+    flights = REGISTRY.get("main.request_flights", SingleFlight, uses_creds=False)
+    return flights.do(json.dumps([query, retrieval_query, filter], sort_keys=True), answer)
 
 st.set_page_config(page_title="YourMyth", page_icon=":robot:")
 st.header("YourMyth")
@@ -146,8 +190,33 @@ if user_input:
         st.warning('Please insert OpenAI API Key. Instructions [here](https://help.openai.com/en/articles/4936850-where-do-i-find-my-secret-api-key)', icon="⚠️")
         st.stop()
 
-    modified_user_input = prompt.format(country=option_country,recommendations=user_input)
-
-    itinerary = load_LLM(modified_user_input, pinecone_docs)
-
-    st.write(itinerary)
\ No newline at end of file
+    # Only the examples relevant to the chosen country and the user's activities are included
+    assembler = REGISTRY.get("main.prompt_assembler", build_assembler, uses_creds=False)
+    examples = render_examples([option_country], select_examples(country=option_country, interests=user_input))
+    modified_user_input, prompt_report = assembler.assemble(examples, country=option_country, recommendations=user_input)
+    # The static prefix already starts the QA chain's prompt, ahead of the retrieved contexts
+    question = modified_user_input[len(assembler.static_prefix):]
+
+    placeholder = st.empty()
+    # Documents in the local vector store carry the country they describe
+    country_filter = {"country": option_country} if use_local_index else None
+
+    def recommend(job):
+        handler = StreamlitTokenHandler(job.slot("recommendation"), names=["Recommendation"])
+        # Retrieve with the user's own words rather than the whole rendered prompt
+        itinerary = load_LLM(question, f"{option_country}: {user_input}", retrieval, handler, country_filter)
+        return itinerary, handler.latency_report()
+
+    # Runs in the background; editing the request supersedes it instead of waiting for it
+    job = session_jobs().submit("recommendation", (option_country, user_input), recommend)
+    try:
+        itinerary, latency_report = poll(job, {"recommendation": placeholder}, st.empty())
+    except SchedulerSaturated as e:
+        # Too many requests are waiting for the model; the next rerun submits the request again
+        placeholder.warning(str(e))
+    else:
+        placeholder.write(itinerary)
+        st.caption(latency_report)
+        st.caption(format_report(prompt_report))
+
+sidebar_panel(config)
@@ -0,0 +1,233 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import folium
+from folium.plugins import FastMarkerCluster
+
+from metrics import METRICS
+
+# Center of the maps that have no markers to center on: Greece, where the places dataset is
+DEFAULT_CENTER = (38.5, 23.5)
+DEFAULT_ZOOM = 6
+
+
+def element_coordinates(element):
+    """Returns [lat, lon] of an Overpass element: nodes carry them directly, ways and relations via "center"."""
+    if "lat" in element and "lon" in element:
+        return [element["lat"], element["lon"]]
+    center = element.get("center")
+    if center and "lat" in center and "lon" in center:
+        return [center["lat"], center["lon"]]
+    return None
+
+
+def overpass_points(response):
+    """Returns the [lat, lon] pairs of every located element in an Overpass response."""
+    points = []
+    for element in response.get("elements", []):
+        coordinates = element_coordinates(element)
+        if coordinates is not None:
+            points.append(coordinates)
+    return points
+
+
+def feature_collection(points, popups=None):
+    """Returns a GeoJSON FeatureCollection with a Point per [lat, lon], carrying its popup text if given."""
+    features = []
+    for i, (lat, lon) in enumerate(points):
+        properties = {} if popups is None else {"popup": str(popups[i])}
+        features.append({"type": "Feature", "properties": properties,
+                         "geometry": {"type": "Point", "coordinates": [float(lon), float(lat)]}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+def marker_map(center, points, popups=None, zoom_start=12):
+    """Returns a folium Map with the points as markers in a single GeoJSON layer.
+
+    The markers are shipped as one FeatureCollection instead of a Marker object
+    and script block each, which keeps the HTML small and fast to serialize.
+    """
+    m = folium.Map(location=list(center), zoom_start=zoom_start)
+    # GeoJsonPopup checks its field against the features, so a map without markers has none
+    popup = folium.GeoJsonPopup(fields=["popup"], labels=False) if popups else None
+    folium.GeoJson(feature_collection(points, popups), name="markers", popup=popup).add_to(m)
+    return m
+
+
+def _selected_places_markers(selected_places):
+    points = selected_places[["latitude", "longitude"]].to_numpy().tolist()
+    popups = [f"{name} ({rating})" for name, rating in zip(selected_places["place_name"], selected_places["rating"])]
+    return points, popups
+
+
+def _coordinates_markers(coordinates):
+    return [list(coord) for coord in coordinates.values()], list(coordinates)
+
+
+def _places_center(points):
+    # The first (best-rated) result
+    return tuple(points[0]) if points else DEFAULT_CENTER
+
+
+def _coordinates_center(coordinates):
+    if not coordinates:
+        return DEFAULT_CENTER
+    center_lat = sum(coord[0] for coord in coordinates.values()) / len(coordinates)
+    center_lng = sum(coord[1] for coord in coordinates.values()) / len(coordinates)
+    return center_lat, center_lng
+
+
+def places_map(selected_places, zoom_start=12):
+    """Returns a folium Map centered on the first of the selected places, with a marker per place.
+
+    With no places selected, the map shows the whole of Greece.
+    """
+    points, popups = _selected_places_markers(selected_places)
+    return marker_map(_places_center(points), points, popups, zoom_start if points else DEFAULT_ZOOM)
+
+
+def coordinates_map(coordinates, zoom_start=16):
+    """Returns a folium Map centered on the mean of {place: (lat, lng)}, with a marker per place, or on Greece if empty."""
+    points, popups = _coordinates_markers(coordinates)
+    return marker_map(_coordinates_center(coordinates), points, popups, zoom_start if points else DEFAULT_ZOOM)
+
+
+def cluster_map(points, zoom_start=11):
+    """Returns a folium Map with the points in one client-side clustered layer.
+
+    FastMarkerCluster ships the coordinates as a single array and creates the
+    markers in the browser, so the HTML stays small however many points there are.
+    """
+    m = folium.Map(location=points[0], zoom_start=zoom_start)
+    FastMarkerCluster(points).add_to(m)
+    return m
+
+
+def map_html(m):
+    """Returns the full HTML page of a folium Map, as folium_static renders it."""
+    figure = m.get_root()
+    if not isinstance(figure, folium.Figure):
+        figure = folium.Figure().add_child(m)
+    return figure.render()
+
+
+class MapHtmlCache:
+    """LRU cache of rendered map HTML, keyed on a hash of the map kind, center, zoom and markers.
+
+    Reruns that show the same markers, such as those caused by unrelated
+    widgets, reuse the HTML instead of building and serializing the map again.
+    Entries are evicted beyond `max_bytes` of HTML.
+    """
+
+    def __init__(self, max_bytes=32 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(kind, center, zoom, points, popups=None):
+        rounded = [[round(float(lat), 6), round(float(lon), 6)] for lat, lon in points]
+        payload = json.dumps([kind, [round(float(c), 6) for c in center], zoom, rounded, popups], default=str)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def get_or_render(self, key, build):
+        """Returns the cached HTML for `key`, or renders `build()` (a folium Map) and caches it."""
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                METRICS.count("cache.requests", cache="map", result="hit")
+                return self.entries[key]
+            self.misses += 1
+        METRICS.count("cache.requests", cache="map", result="miss")
+        with METRICS.span("map.serialize"):
+            html = map_html(build())
+        METRICS.count("map.html_bytes", len(html))
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = html
+                self.size += len(html)
+            while self.size > self.max_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+        return html
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0,
+                    "entries": len(self.entries), "bytes": self.size}
+
+
+# Shared by every app running in this process
+MAP_CACHE = MapHtmlCache()
+METRICS.gauge("cache.hit_rate", lambda: MAP_CACHE.stats()["hit_rate"], cache="map")
+
+
+def places_map_html(selected_places, zoom_start=12, cache=MAP_CACHE):
+    """Returns the HTML of places_map, rendered once per distinct set of places."""
+    points, popups = _selected_places_markers(selected_places)
+    key = cache.key("places", _places_center(points), zoom_start, points, popups)
+    return cache.get_or_render(key, lambda: places_map(selected_places, zoom_start))
+
+
+def coordinates_map_html(coordinates, zoom_start=16, cache=MAP_CACHE):
+    """Returns the HTML of coordinates_map, rendered once per distinct set of places."""
+    points, popups = _coordinates_markers(coordinates)
+    key = cache.key("coordinates", _coordinates_center(coordinates), zoom_start, points, popups)
+    return cache.get_or_render(key, lambda: coordinates_map(coordinates, zoom_start))
+
+
+def cluster_map_html(points, zoom_start=11, cache=MAP_CACHE):
+    """Returns the HTML of cluster_map, rendered once per distinct set of points."""
+    key = cache.key("cluster", points[0], zoom_start, points)
+    return cache.get_or_render(key, lambda: cluster_map(points, zoom_start))
+
+
+def show_map_html(html, width=700, height=500):
+    """Displays rendered map HTML in Streamlit, in the same frame folium_static uses."""
+    import streamlit.components.v1 as components
+
+    components.html(html, width=width, height=height + 10)
+
+
+def reader_context(response, encoding, token_budget):
+    """Returns (text, included, total) describing an Overpass response within a token budget.
+
+    Each located element is reduced to its name, tags and rounded coordinates,
+    one compact JSON object per line. Named elements come first, and elements are
+    added until the budget is used up, so a large response still yields a summary.
+    """
+    items = []
+    for element in response.get("elements", []):
+        coordinates = element_coordinates(element)
+        if coordinates is None:
+            continue
+        tags = dict(element.get("tags", {}))
+        name = tags.pop("name", None)
+        # Translated names add many tokens and little information
+        tags = {k: v for k, v in tags.items() if not k.startswith(("name:", "source"))}
+        item = {"name": name, "tags": tags, "lat": round(coordinates[0], 5), "lon": round(coordinates[1], 5)}
+        if name is None:
+            del item["name"]
+        items.append(item)
+    items.sort(key=lambda item: "name" not in item)
+
+    lines = []
+    used = 0
+    for item in items:
+        line = json.dumps(item, ensure_ascii=False, separators=(",", ":"))
+        tokens = len(encoding.encode(line)) + 1
+        if used + tokens > token_budget:
+            break
+        lines.append(line)
+        used += tokens
+    included = len(lines)
+    if included < len(items):
+        lines.append(f"... and {len(items) - included} more results.")
+    return "\n".join(lines), included, len(items)
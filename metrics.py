@@ -0,0 +1,238 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+logger = logging.getLogger(__name__)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _prometheus_name(name):
+    return "yourmyth_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def _prometheus_labels(labels, **extra):
+    labels = list(labels) + sorted(extra.items())
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    """Count and sum of all observations, and quantiles over the most recent `window` ones."""
+
+    def __init__(self, window=4096):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def quantiles(self, quantiles=QUANTILES):
+        if not self.samples:
+            return {q: None for q in quantiles}
+        values = np.quantile(np.fromiter(self.samples, dtype=np.float64), quantiles)
+        return dict(zip(quantiles, values.tolist()))
+
+
+class Metrics:
+    """Process-wide latency histograms, counters and gauges, keyed on a name and labels.
+
+    Stages are timed with `span`, which records seconds into the histogram of the
+    same name. Gauges are callables read at export time, such as cache hit rates.
+    """
+
+    def __init__(self, window=4096):
+        self.window = window
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.server = None
+        # Set when the port could not be bound, so later reruns do not try again
+        self.serve_error = None
+        self.writer = None
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(self.window)
+            self.histograms[key].observe(value)
+
+    def count(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, read, **labels):
+        """Registers `read()` as the current value of a gauge, replacing any earlier one."""
+        with self.lock:
+            self.gauges[_key(name, labels)] = read
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Times the block into the `name` histogram; failures are also counted in `<name>.errors`."""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.count(name + ".errors", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def tokens(self, model, encoding, prompt="", completion=""):
+        """Counts the prompt and completion tokens of an LLM call."""
+        self.count("llm.prompt_tokens", len(encoding.encode(prompt)), model=model)
+        self.count("llm.completion_tokens", len(encoding.encode(completion)), model=model)
+
+    def snapshot(self):
+        """Returns the current values as a JSON-serializable dict."""
+        with self.lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+            gauges = list(self.gauges.items())
+            summaries = [(key, h.count, h.sum, h.quantiles()) for key, h in histograms]
+        gauge_values = []
+        for key, read in gauges:
+            try:
+                gauge_values.append((key, float(read())))
+            except Exception:
+                continue
+        return {
+            "time": time.time(),
+            "histograms": [
+                {"name": name, "labels": dict(labels), "count": count, "sum": total,
+                 **{f"p{round(q * 100)}": value for q, value in quantiles.items()}}
+                for (name, labels), count, total, quantiles in summaries
+            ],
+            "counters": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in counters],
+            "gauges": [{"name": name, "labels": dict(labels), "value": value} for (name, labels), value in gauge_values],
+        }
+
+    def prometheus_text(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        kinds = (("histograms", "summary", "_seconds"), ("counters", "counter", "_total"), ("gauges", "gauge", ""))
+        for kind, prometheus_type, suffix in kinds:
+            typed = set()
+            for item in snapshot[kind]:
+                name = _prometheus_name(item["name"]) + suffix
+                labels = sorted(item["labels"].items())
+                if name not in typed:
+                    lines.append(f"# TYPE {name} {prometheus_type}")
+                    typed.add(name)
+                if kind != "histograms":
+                    lines.append(f"{name}{_prometheus_labels(labels)} {item['value']}")
+                    continue
+                for q in QUANTILES:
+                    value = item[f"p{round(q * 100)}"]
+                    if value is not None:
+                        lines.append(f"{name}{_prometheus_labels(labels, quantile=q)} {value}")
+                lines.append(f"{name}_sum{_prometheus_labels(labels)} {item['sum']}")
+                lines.append(f"{name}_count{_prometheus_labels(labels)} {item['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_jsonl(self, path):
+        """Appends one snapshot line to a JSONL file."""
+        with open(path, "a") as f:
+            f.write(json.dumps(self.snapshot()) + "\n")
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serves /metrics in the Prometheus format from a daemon thread (once per process).
+
+        If the port is taken, such as by another app using the same creds.yaml, the
+        error is logged once and the metrics are not served from this process.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        with self.lock:
+            if self.server is not None or self.serve_error is not None:
+                return
+            try:
+                self.server = ThreadingHTTPServer((host, port), Handler)
+            except OSError as e:
+                self.serve_error = e
+                logger.warning("Not serving metrics: cannot listen on %s:%s (%s)", host, port, e)
+                return
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def write_periodically(self, path, interval=60):
+        """Appends a snapshot to `path` every `interval` seconds from a daemon thread (once per process)."""
+        def run():
+            while True:
+                time.sleep(interval)
+                self.write_jsonl(path)
+
+        with self.lock:
+            if self.writer is not None:
+                return
+            self.writer = threading.Thread(target=run, daemon=True)
+        self.writer.start()
+
+
+# Shared by every app running in this process
+METRICS = Metrics()
+
+
+def configure(config):
+    """Starts the exporters enabled in creds.yaml.
+
+    METRICS_PORT serves Prometheus text on that port, METRICS_JSONL appends a
+    snapshot to that file every METRICS_INTERVAL seconds (default 60).
+    """
+    if config.get("METRICS_PORT"):
+        METRICS.serve(int(config["METRICS_PORT"]))
+    if config.get("METRICS_JSONL"):
+        METRICS.write_periodically(config["METRICS_JSONL"], float(config.get("METRICS_INTERVAL", 60)))
+
+
+def sidebar_panel(config, metrics=METRICS):
+    """Shows the metrics in the Streamlit sidebar if SHOW_METRICS is set in creds.yaml."""
+    if not config.get("SHOW_METRICS"):
+        return
+    import pandas as pd
+    import streamlit as st
+
+    def label(item):
+        labels = ", ".join(f"{k}={v}" for k, v in item["labels"].items())
+        return f"{item['name']} ({labels})" if labels else item["name"]
+
+    snapshot = metrics.snapshot()
+    with st.sidebar.expander("Metrics"):
+        if snapshot["histograms"]:
+            st.dataframe(pd.DataFrame([
+                {"stage": label(h), "count": h["count"],
+                 **{p: None if h[p] is None else round(h[p] * 1000, 1) for p in ("p50", "p95", "p99")}}
+                for h in snapshot["histograms"]
+            ]).set_index("stage").rename(columns=lambda c: c if c == "count" else f"{c} ms"))
+        for item in snapshot["counters"] + snapshot["gauges"]:
+            value = item["value"]
+            st.text(f"{label(item)}: {value:.2f}" if isinstance(value, float) else f"{label(item)}: {value}")
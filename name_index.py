@@ -0,0 +1,106 @@
+import math
+import threading
+
+import numpy as np
+
+from places_store import gather_csr, trigram_codes
+
+# Lowest trigram similarity (shared / all distinct trigrams of both names) accepted as the same place
+MIN_SIMILARITY = 0.5
+
+
+class NameIndex:
+    """Fuzzy lookup of place names in the places dataset, over the store's trigram index.
+
+    A name is matched by counting the trigrams each candidate shares with it and
+    scoring them by Jaccard similarity; ties go to the higher-rated place. Names
+    resolved from the dataset skip the network geocoder, and the share of them
+    is kept in `stats`. Only places with coordinates are matched, since a
+    match stands in for geocoding the name.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.trigrams = store.arrays["names.trigrams"]
+        self.offsets = store.arrays["names.offsets"]
+        self.rows = store.arrays["names.rows"]
+        self.counts = store.arrays["names.counts"]
+        self.located = np.isfinite(store.arrays["latitude"]) & np.isfinite(store.arrays["longitude"])
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def match(self, name, rows=None, min_similarity=MIN_SIMILARITY):
+        """Returns (row, similarity) of the place best matching the name, or None.
+
+        `rows`, if given, are the sorted rows the match is restricted to, such as
+        the places in the trip's location.
+        """
+        query = np.asarray(trigram_codes(name), dtype=np.int64)
+        found = np.searchsorted(self.trigrams, query)
+        indexed = found < len(self.trigrams)
+        indexed[indexed] = self.trigrams[found[indexed]] == query[indexed]
+        ids = found[indexed]
+        # Jaccard similarity of at least min_similarity needs at least this many shared trigrams
+        needed = max(1, math.ceil(min_similarity * len(query)))
+        if len(ids) < needed:
+            return None
+        # Shared trigrams per row, counted over the posting lists of the name's trigrams
+        shared = np.bincount(gather_csr(self.offsets, self.rows, ids), minlength=len(self.counts))
+        candidates = np.flatnonzero((shared >= needed) & self.located)
+        if rows is not None:
+            candidates = candidates[np.isin(candidates, rows)]
+        if len(candidates) == 0:
+            return None
+        shared = shared[candidates]
+        similarity = shared / (len(query) + self.counts[candidates] - shared)
+        # Rows are in rating order, so the first best match is the best-rated one
+        best = int(np.argmax(similarity))
+        if similarity[best] < min_similarity:
+            return None
+        return int(candidates[best]), float(similarity[best])
+
+    def coordinates(self, name, rows=None):
+        """Returns (lat, lng) of the place matching the name, or None."""
+        match = self.match(name, rows)
+        if match is None:
+            return None
+        row = match[0]
+        return float(self.store.arrays["latitude"][row]), float(self.store.arrays["longitude"][row])
+
+    def _count(self, hits, misses, tally=None):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+            if tally is not None:
+                tally["hits"] = tally.get("hits", 0) + hits
+                tally["misses"] = tally.get("misses", 0) + misses
+
+    def resolve(self, place, geocoder, rows=None, tally=None):
+        """Returns (lat, lng) of a place from the dataset, or from the geocoder if it is not found there.
+
+        `tally`, if given, is a dict whose "hits" and "misses" count this call's
+        outcome, on top of the totals kept in `stats`.
+        """
+        latlng = self.coordinates(place, rows)
+        self._count(latlng is not None, latlng is None, tally)
+        return latlng if latlng is not None else geocoder.resolve(place)
+
+    def resolve_many(self, places, geocoder, rows=None, tally=None):
+        """Returns {place: (lat, lng)} like GeocodeCache.resolve_many, geocoding only the unmatched places."""
+        places = list(places)
+        results = {}
+        for place in places:
+            latlng = self.coordinates(place, rows)
+            if latlng is not None:
+                results[place] = latlng
+        missing = [place for place in places if place not in results]
+        self._count(len(places) - len(missing), len(missing), tally)
+        if missing:
+            results.update(geocoder.resolve_many(missing))
+        return {place: results[place] for place in places if place in results}
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import zlib
+
+from metrics import METRICS
+from single_flight import SingleFlight
+
+# Strings are matched first so that comment markers and whitespace inside them are left alone
+QUERY_TOKEN_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|(?:/\*.*?\*/|//[^\n]*|\s)+', re.S)
+
+
+def normalize_query(query):
+    """Returns the query with comments removed and whitespace collapsed outside of string literals."""
+    def replace(match):
+        token = match.group(0)
+        return token if token[0] in "\"'" else " "
+
+    return QUERY_TOKEN_PATTERN.sub(replace, query).strip()
+
+
+class OverpassCache:
+    """On-disk cache of Overpass API responses keyed on the normalized query.
+
+    Responses are stored as zlib-compressed JSON, one file per query, together
+    with the ETag/Last-Modified validators the server sent. Fresh entries (younger
+    than `ttl` seconds) are served without touching the network; stale ones are
+    revalidated with a conditional request, and still served if the refresh fails.
+    The least recently used files are removed once the cache exceeds `max_bytes`.
+    Concurrent requests for the same query wait for a single fetch.
+    """
+
+    def __init__(self, directory=".overpass_cache", ttl=3600, max_bytes=50 * 1024 * 1024):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.flights = SingleFlight()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, query):
+        key = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, key + ".json.z")
+
+    def _read(self, path):
+        try:
+            with open(path, "rb") as f:
+                return json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            return None
+
+    def _write(self, path, entry):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(zlib.compress(json.dumps(entry).encode("utf-8")))
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".json.z"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def get(self, query, fetch):
+        """Returns the JSON response for the query.
+
+        `fetch(query, headers)` performs the request and returns a requests-style
+        response; it is only called on a miss or to revalidate a stale entry.
+        """
+        path = self._path(query)
+        entry = self._fresh(path)
+        if entry is not None:
+            METRICS.count("cache.requests", cache="overpass", result="hit")
+            return entry["response"]
+        METRICS.count("cache.requests", cache="overpass", result="miss")
+        return self.flights.do(path, lambda: self._refresh(query, path, fetch))
+
+    def _fresh(self, path):
+        entry = self._read(path)
+        if entry is not None and time.time() - entry["fetched"] < self.ttl:
+            # Touch the file so eviction sees it as recently used; another worker may have evicted it since
+            # the read, and the entry read is still good
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return entry
+        return None
+
+    def _refresh(self, query, path, fetch):
+        entry = self._read(path)
+        now = time.time()
+        if entry is not None and now - entry["fetched"] < self.ttl:
+            # The previous flight for this query wrote it since the caller's lookup
+            return entry["response"]
+
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            with METRICS.span("overpass.fetch"):
+                response = fetch(query, headers)
+        except Exception:
+            if entry is not None:
+                return entry["response"]
+            raise
+
+        if response.status_code == 304 and entry is not None:
+            entry["fetched"] = now
+            self._write(path, entry)
+            return entry["response"]
+        if not response.ok and entry is not None:
+            return entry["response"]
+
+        data = response.json()
+        if response.ok:
+            self._write(path, {
+                "fetched": now,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "response": data,
+            })
+        return data
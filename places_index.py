@@ -0,0 +1,240 @@
+import bisect
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from places_store import PlacesStore
+from spatial_index import SpatialIndex, haversine_km
+from name_index import NameIndex
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """Returns the lowercase word tokens of an address or location string."""
+    return TOKEN_PATTERN.findall(str(text).casefold())
+
+
+def extract_unique_filters(data):
+    """Returns the sorted distinct types in the has_type column."""
+    all_filters = set()
+    for types in data["has_type"].dropna().astype(str):
+        all_filters.update(types.split(', '))
+    return sorted(list(all_filters))
+
+
+class PlacesIndex:
+    """Pre-indexed, rating-ordered view of the places dataset.
+
+    Built once per process so that location and filter lookups are set
+    intersections over integer row ids instead of pandas scans per rerun. The
+    data lives in a PlacesStore; loaded from disk it is memory-mapped, and only
+    the rows a query returns are decoded into a DataFrame.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        # Inverted index over address tokens: sorted tokens, and the sorted row ids of each
+        self.tokens = store.tokens
+        self.posting_offsets = store.arrays["postings.offsets"]
+        self.posting_rows = store.arrays["postings.rows"]
+
+        # Multi-hot has_type matrix, packed to one bit per (row, type)
+        self.types = store.types
+        self.type_ids = {t: i for i, t in enumerate(self.types)}
+        self.type_bits = store.arrays["type_bits"]
+
+        # Filter vocabulary and counts per location, for the filter widget
+        self.facets = FacetIndex(self)
+
+        # Grid over the places' coordinates, for radius and nearest queries
+        self.spatial = SpatialIndex(store)
+
+        # Trigram index over place names, to resolve names without geocoding them
+        self.names = NameIndex(store)
+
+    def __len__(self):
+        return len(self.store)
+
+    @classmethod
+    def from_frame(cls, data):
+        return cls(PlacesStore.from_frame(data))
+
+    @classmethod
+    def from_csv(cls, path, store_directory=".places_store"):
+        """Loads the index from the binary copy of the CSV, converting it on first use."""
+        return cls(PlacesStore.open(path, store_directory))
+
+    def _postings(self, i):
+        return self.posting_rows[self.posting_offsets[i]:self.posting_offsets[i + 1]]
+
+    def _token_rows(self, token, prefix=False):
+        start = bisect.bisect_left(self.tokens, token)
+        if not prefix:
+            if start < len(self.tokens) and self.tokens[start] == token:
+                return self._postings(start)
+            return np.empty(0, dtype=np.int32)
+        # The last token may still be being typed, so match every indexed token it prefixes
+        end = bisect.bisect_left(self.tokens, token + "\uffff", lo=start)
+        if end == start:
+            return np.empty(0, dtype=np.int32)
+        return np.unique(self.posting_rows[self.posting_offsets[start]:self.posting_offsets[end]])
+
+    def location_rows(self, location):
+        """Returns the sorted row ids whose address contains every token of the location."""
+        tokens = tokenize(location)
+        if not tokens:
+            return np.arange(len(self), dtype=np.int64)
+        posting_lists = [self._token_rows(t) for t in tokens[:-1]]
+        posting_lists.append(self._token_rows(tokens[-1], prefix=True))
+        # Intersect starting from the rarest token to keep intermediate results small
+        posting_lists.sort(key=len)
+        rows = posting_lists[0]
+        for other in posting_lists[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def filter_mask(self, filters):
+        """Returns the packed bitmask selecting any of the given types."""
+        mask = np.zeros(len(self.types), dtype=bool)
+        for f in filters:
+            if f in self.type_ids:
+                mask[self.type_ids[f]] = True
+        return np.packbits(mask)
+
+    def filter_rows(self, rows, filters):
+        """Returns the subset of rows that have at least one of the given types."""
+        if len(rows) == 0:
+            return rows
+        mask = self.filter_mask(filters)
+        return rows[(self.type_bits[rows] & mask).any(axis=1)]
+
+    def top_places(self, location, filters, n):
+        """Returns the n top-rated places in the location matching any of the filters."""
+        rows = self.filter_rows(self.location_rows(location), filters)
+        return self.store.frame(rows[:n])
+
+    def top_places_near(self, point, radius_km, filters, n):
+        """Returns the n top-rated places within radius_km of point (lat, lng) matching any of the filters."""
+        rows, distances = self.spatial.within(point[0], point[1], radius_km)
+        keep = np.isin(rows, self.filter_rows(rows, filters), assume_unique=True)
+        frame = self.store.frame(rows[keep][:n])
+        frame["distance_km"] = distances[keep][:n]
+        return frame
+
+    def top_places_around(self, location, point, radius_km, filters, n, max_radius_km=None):
+        """Returns the n top-rated places matching any of the filters, in the location or near point (lat, lng).
+
+        Addresses naming the location cover regions and islands wider than the
+        radius; the radius covers places whose address does not name it. While
+        fewer than n places are found, the radius doubles up to `max_radius_km`
+        (four times radius_km by default). `point` may be None if the location
+        could not be geocoded.
+        """
+        rows = self.filter_rows(self.location_rows(location), filters)
+        if point is not None:
+            max_radius_km = max_radius_km or 4 * radius_km
+            while True:
+                near, _ = self.spatial.within(point[0], point[1], radius_km)
+                near = np.union1d(rows, self.filter_rows(near, filters))
+                if len(near) >= n or radius_km >= max_radius_km:
+                    break
+                radius_km = min(2 * radius_km, max_radius_km)
+            rows = near
+        frame = self.store.frame(rows[:n])
+        if point is not None:
+            frame["distance_km"] = haversine_km(point[0], point[1], self.store.arrays["latitude"][rows[:n]],
+                                                self.store.arrays["longitude"][rows[:n]])
+        return frame
+
+    def nearest_places(self, point, k, filters=None):
+        """Returns the k places nearest to point (lat, lng), nearest first, optionally of the given types."""
+        select = (lambda rows: self.filter_rows(rows, filters)) if filters else None
+        rows, distances = self.spatial.nearest(point[0], point[1], k, select)
+        frame = self.store.frame(rows)
+        frame["distance_km"] = distances
+        return frame
+
+
+class FacetIndex:
+    """Sorted type vocabulary with the number of places of each type, overall and per location.
+
+    The counts per address token are precomputed with the PlacesStore, so a
+    single-token location is a slice lookup; longer locations count the types of
+    their rows once and are then served from a small cache. Rows added later
+    with `add` are counted on top, so the filters stay current without
+    reconverting the dataset.
+    """
+
+    def __init__(self, index, cache_size=256):
+        self.index = index
+        store = index.store
+        self.offsets = store.arrays["facets.offsets"]
+        self.type_codes = store.arrays["facets.types"]
+        self.counts = store.arrays["facets.counts"]
+        self.totals = dict(zip(index.types, store.arrays["facets.totals"].tolist()))
+        self.vocabulary = sorted(self.totals)
+        # Rows added since the store was built: (address tokens, types) of each
+        self.added = []
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, data):
+        """Counts new rows shaped like places_greece.csv into the vocabulary and facets."""
+        rows = []
+        for address, types in zip(data["place_address"].fillna(""), data["has_type"].fillna("")):
+            types = {t for t in str(types).split(", ") if t}
+            rows.append((frozenset(tokenize(address)), types))
+        with self.lock:
+            for _, types in rows:
+                for t in types:
+                    if t not in self.totals:
+                        bisect.insort(self.vocabulary, t)
+                        self.totals[t] = 0
+                    self.totals[t] += 1
+            self.added.extend(rows)
+            self.cache.clear()
+
+    def _base_counts(self, tokens):
+        index = self.index
+        start = bisect.bisect_left(index.tokens, tokens[-1])
+        end = bisect.bisect_left(index.tokens, tokens[-1] + "\uffff", lo=start)
+        if end == start:
+            return {}
+        if len(tokens) == 1 and end == start + 1:
+            span = slice(self.offsets[start], self.offsets[start + 1])
+            return {index.types[c]: int(n) for c, n in zip(self.type_codes[span], self.counts[span])}
+        rows = index.location_rows(" ".join(tokens))
+        counts = np.unpackbits(index.type_bits[rows], axis=1, count=len(index.types)).sum(axis=0)
+        return {index.types[c]: int(counts[c]) for c in np.flatnonzero(counts)}
+
+    def facet_counts(self, location=""):
+        """Returns {type: number of places} for the places in the location, for types with any."""
+        tokens = tuple(tokenize(location))
+        if not tokens:
+            return {t: n for t, n in self.totals.items() if n}
+        with self.lock:
+            if tokens in self.cache:
+                self.cache.move_to_end(tokens)
+                return self.cache[tokens]
+            added = list(self.added)
+        counts = self._base_counts(tokens)
+        # Added rows match like the index does: every token, the last one as a prefix
+        for address_tokens, types in added:
+            if all(t in address_tokens for t in tokens[:-1]) and any(t.startswith(tokens[-1]) for t in address_tokens):
+                for t in types:
+                    counts[t] = counts.get(t, 0) + 1
+        with self.lock:
+            self.cache[tokens] = counts
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return counts
+
+    def options(self, location=""):
+        """Returns the sorted types present in the location and their counts, for a filter widget."""
+        counts = self.facet_counts(location)
+        return [t for t in self.vocabulary if t in counts], counts
@@ -0,0 +1,276 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+TOKEN_PATTERN = r"\w+"
+# Bumped whenever the saved layout changes, so older conversions are rebuilt
+FORMAT_VERSION = 4
+# Side of the spatial grid cells in degrees, about 5.5 km of latitude
+GRID_DEGREES = 0.05
+# Object columns with fewer distinct values than this share of rows are dictionary-encoded
+CATEGORY_RATIO = 0.5
+
+
+def _encode_strings(values):
+    """Returns (blob, offsets) holding the UTF-8 bytes of each string back to back."""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+class StringArray:
+    """Read-only sequence of strings decoded on access from a UTF-8 blob and offsets.
+
+    Supports len, indexing and so bisect, without materializing Python strings.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def take(self, rows):
+        return [self[r] for r in rows]
+
+
+def _csr(rows, values, n_rows):
+    """Returns (offsets, values) of a CSR layout from (row, value) pairs sorted by row."""
+    offsets = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=offsets[1:])
+    return offsets, values
+
+
+def normalize_name(name):
+    """Returns a place name casefolded, without accents or punctuation, single-spaced."""
+    name = unicodedata.normalize("NFKD", str(name).casefold())
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", name).split())
+
+
+def trigram_codes(name):
+    """Returns the sorted distinct character trigrams of a normalized name, each packed into one integer."""
+    name = normalize_name(name)
+    if not name:
+        return []
+    # Padding makes the start and end of the name count as their own trigrams
+    points = [ord(c) for c in f"  {name} "]
+    return sorted({(a << 42) | (b << 21) | c for a, b, c in zip(points, points[1:], points[2:])})
+
+
+def gather_csr(offsets, values, indices):
+    """Returns the concatenated values of the given CSR rows, without a Python loop over them."""
+    starts = offsets[indices]
+    lengths = offsets[np.asarray(indices) + 1] - starts
+    return values[np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())]
+
+
+def grid_cells(latitudes, longitudes, degrees=GRID_DEGREES):
+    """Returns the integer ids of the grid cells holding the given points, numbered row-major from (-90, -180)."""
+    columns = int(np.ceil(360 / degrees))
+    lat_cells = np.floor((np.asarray(latitudes) + 90) / degrees).astype(np.int64)
+    lon_cells = np.floor((np.asarray(longitudes) + 180) / degrees).astype(np.int64) % columns
+    return lat_cells * columns + lon_cells
+
+
+def source_fingerprint(path):
+    stat = os.stat(path)
+    source = f"{FORMAT_VERSION}|{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+
+
+class PlacesStore:
+    """Columnar copy of the places dataset, saved as .npy files that load memory-mapped.
+
+    Rows are sorted by rating (best first, NaN last), so row position is rank.
+    Numeric columns are typed arrays; text columns are either dictionary-encoded
+    (int32 codes into a vocabulary) or UTF-8 blobs with offsets. has_type is
+    stored as integer type codes per row (CSR) plus a packed multi-hot matrix,
+    and the address tokens as a sorted vocabulary with posting lists of row ids
+    and per-token facet counts (places of each type). Located rows are also
+    bucketed into a grid of GRID_DEGREES cells for radius queries, and place
+    names are indexed by character trigrams for fuzzy matching.
+    Worker processes that load the same files share their pages through the
+    page cache instead of each holding Python string objects.
+    """
+
+    def __init__(self, n_rows, columns, arrays, types):
+        self.n_rows = n_rows
+        # Column name -> "numeric", "category", "string" or "types" (has_type)
+        self.columns = columns
+        self.arrays = arrays
+        self.types = types
+        self.tokens = self.strings("tokens")
+
+    def strings(self, name):
+        return StringArray(self.arrays[f"{name}.data"], self.arrays[f"{name}.offsets"])
+
+    def __len__(self):
+        return self.n_rows
+
+    @classmethod
+    def from_frame(cls, data):
+        """Encodes a DataFrame shaped like places_greece.csv."""
+        order = data["rating"].sort_values(ascending=False, kind="mergesort", na_position="last").index
+        data = data.loc[order].reset_index(drop=True)
+        n_rows = len(data)
+        columns, arrays = {}, {}
+
+        for name in data.columns:
+            series = data[name]
+            if name == "has_type":
+                columns[name] = "types"
+                continue
+            if pd.api.types.is_numeric_dtype(series):
+                columns[name] = "numeric"
+                arrays[name] = series.to_numpy()
+                continue
+            nulls = series.isna().to_numpy()
+            values = series.astype(object).where(~nulls, "").astype(str)
+            if values.nunique() < CATEGORY_RATIO * max(n_rows, 1):
+                codes, dictionary = pd.factorize(values, sort=True)
+                codes = codes.astype(np.int32)
+                codes[nulls] = -1
+                columns[name] = "category"
+                arrays[f"{name}.codes"] = codes
+                arrays[f"{name}.dictionary.data"], arrays[f"{name}.dictionary.offsets"] = _encode_strings(dictionary)
+            else:
+                columns[name] = "string"
+                arrays[f"{name}.data"], arrays[f"{name}.offsets"] = _encode_strings(values)
+                arrays[f"{name}.nulls"] = nulls
+
+        # has_type: one (row, type code) pair per distinct type of each place
+        types_exploded = data["has_type"].dropna().astype(str).str.split(", ").explode()
+        types_exploded = types_exploded[types_exploded != ""]
+        pairs = pd.DataFrame({"row": types_exploded.index.to_numpy(np.int64), "type": types_exploded.to_numpy()})
+        pairs = pairs.drop_duplicates()
+        type_codes, types = pd.factorize(pairs["type"], sort=True)
+        rows = pairs["row"].to_numpy()
+        order = np.argsort(rows, kind="stable")
+        arrays["has_type.offsets"], arrays["has_type.codes"] = _csr(rows[order], type_codes[order].astype(np.int16),
+                                                                    n_rows)
+        bits = np.zeros((n_rows, (len(types) + 7) // 8), dtype=np.uint8)
+        np.bitwise_or.at(bits, (rows, type_codes >> 3), (128 >> (type_codes & 7)).astype(np.uint8))
+        arrays["type_bits"] = bits
+
+        # Address tokens: sorted vocabulary, and for each token the sorted rows whose address contains it
+        address_tokens = data["place_address"].fillna("").astype(str).str.casefold().str.findall(TOKEN_PATTERN).explode()
+        address_tokens = address_tokens.dropna()
+        pairs = pd.DataFrame({"row": address_tokens.index.to_numpy(np.int64), "token": address_tokens.to_numpy()})
+        pairs = pairs.drop_duplicates().sort_values(["token", "row"], kind="stable")
+        token_codes, tokens = pd.factorize(pairs["token"], sort=True)
+        arrays["postings.offsets"], arrays["postings.rows"] = _csr(token_codes, pairs["row"].to_numpy(np.int32),
+                                                                   len(tokens))
+        arrays["tokens.data"], arrays["tokens.offsets"] = _encode_strings(tokens)
+
+        # Facets: the number of places of each type overall, and among the places whose address has each token
+        token_types = pd.DataFrame({"token": token_codes, "row": pairs["row"].to_numpy()}).merge(
+            pd.DataFrame({"row": rows, "type": type_codes}), on="row")
+        facets = token_types.groupby(["token", "type"]).size()
+        arrays["facets.offsets"], arrays["facets.types"] = _csr(
+            facets.index.get_level_values("token").to_numpy(), facets.index.get_level_values("type").to_numpy(np.int16),
+            len(tokens))
+        arrays["facets.counts"] = facets.to_numpy(np.int64)
+        arrays["facets.totals"] = np.bincount(type_codes, minlength=len(types)).astype(np.int64)
+
+        # Spatial grid: sorted ids of the occupied cells, and for each cell its rows in rating order
+        latitudes = data["latitude"].to_numpy(np.float64)
+        longitudes = data["longitude"].to_numpy(np.float64)
+        located = np.flatnonzero(~(np.isnan(latitudes) | np.isnan(longitudes)))
+        cells = grid_cells(latitudes[located], longitudes[located])
+        order = np.argsort(cells, kind="stable")
+        cell_ids, cell_codes = np.unique(cells[order], return_inverse=True)
+        arrays["grid.cells"] = cell_ids
+        arrays["grid.offsets"], arrays["grid.rows"] = _csr(cell_codes, located[order].astype(np.int32), len(cell_ids))
+
+        # Place names: sorted trigram codes with the rows whose name has each, and each row's trigram count
+        name_trigrams = data["place_name"].fillna("").map(trigram_codes)
+        exploded = name_trigrams.explode().dropna()
+        pairs = pd.DataFrame({"row": exploded.index.to_numpy(np.int64), "trigram": exploded.to_numpy(np.int64)})
+        pairs = pairs.sort_values(["trigram", "row"], kind="stable")
+        trigram_ids, trigrams = pd.factorize(pairs["trigram"], sort=True)
+        arrays["names.trigrams"] = np.asarray(trigrams, dtype=np.int64)
+        arrays["names.offsets"], arrays["names.rows"] = _csr(trigram_ids, pairs["row"].to_numpy(np.int32),
+                                                             len(trigrams))
+        arrays["names.counts"] = name_trigrams.map(len).to_numpy(np.int32)
+
+        return cls(n_rows, columns, arrays, types.tolist())
+
+    def save(self, directory):
+        """Writes the arrays as .npy files and the rest as meta.json, which is written last."""
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self.arrays.items():
+            np.save(os.path.join(directory, f"{name}.npy"), np.ascontiguousarray(array))
+        meta = {"rows": self.n_rows, "columns": self.columns, "types": self.types, "arrays": sorted(self.arrays)}
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """Loads a saved store, memory-mapping the arrays unless `mmap` is False."""
+        with open(os.path.join(directory, "meta.json")) as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r" if mmap else None)
+                  for name in meta["arrays"]}
+        return cls(meta["rows"], meta["columns"], arrays, meta["types"])
+
+    @classmethod
+    def open(cls, csv_path, directory=".places_store"):
+        """Loads the store converted from `csv_path`, converting the CSV first if it changed.
+
+        Each version of the CSV is converted into its own subdirectory, renamed
+        into place once complete, so concurrent workers never read a partial store.
+        """
+        fingerprint = source_fingerprint(csv_path)
+        target = os.path.join(directory, fingerprint)
+        if not os.path.exists(os.path.join(target, "meta.json")):
+            os.makedirs(directory, exist_ok=True)
+            staging = tempfile.mkdtemp(dir=directory, prefix=".tmp-")
+            try:
+                cls.from_frame(pd.read_csv(csv_path)).save(staging)
+                os.rename(staging, target)
+            except OSError:
+                # Another worker finished the same conversion first
+                if not os.path.exists(os.path.join(target, "meta.json")):
+                    raise
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            # Remove the conversions of earlier versions of the CSV
+            for entry in os.scandir(directory):
+                if entry.is_dir() and entry.name != fingerprint and not entry.name.startswith(".tmp-"):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+        return cls.load(target)
+
+    def column(self, name, rows):
+        """Returns the decoded values of a column for the given rows."""
+        kind = self.columns[name]
+        if kind == "numeric":
+            return np.asarray(self.arrays[name][rows])
+        if kind == "category":
+            dictionary = self.strings(f"{name}.dictionary")
+            return [dictionary[c] if c >= 0 else None for c in self.arrays[f"{name}.codes"][rows]]
+        if kind == "string":
+            values = self.strings(name).take(rows)
+            return [None if null else value for value, null in zip(values, self.arrays[f"{name}.nulls"][rows])]
+        return [", ".join(self.types[c] for c in self.row_types(r)) or None for r in rows]
+
+    def row_types(self, row):
+        offsets = self.arrays["has_type.offsets"]
+        return self.arrays["has_type.codes"][offsets[row]:offsets[row + 1]]
+
+    def frame(self, rows):
+        """Returns the given rows as a DataFrame with the CSV's columns."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return pd.DataFrame({name: self.column(name, rows) for name in self.columns}, index=rows)
@@ -0,0 +1,82 @@
+import re
+
+from destinations import DESTINATIONS
+
+WORD_PATTERN = re.compile(r"[a-z]{3,}")
+STOPWORDS = {"the", "and", "for", "with", "you", "its", "are", "can", "also", "has", "that", "this", "which", "want"}
+
+
+def keywords(text):
+    """Returns the set of lowercase words of three or more letters in the text, minus stopwords."""
+    return set(WORD_PATTERN.findall(str(text).casefold())) - STOPWORDS
+
+
+def select_examples(country=None, location=None, interests="", limit=3):
+    """Returns up to `limit` destination descriptions most relevant to the request.
+
+    A destination named in the location ranks first, then destinations in the
+    chosen country, then by the number of words shared with the user's interests
+    (activities, filters or free text). At least one example is always returned
+    so the model still sees the expected format.
+    """
+    wanted = keywords(interests)
+    scored = []
+    for position, destination in enumerate(DESTINATIONS):
+        score = len(wanted & keywords(destination["text"]))
+        if country and destination["country"] == country:
+            score += 10
+        if location and destination["name"].casefold() in str(location).casefold():
+            score += 100
+        scored.append((-score, position, destination))
+    scored.sort(key=lambda item: item[:2])
+    relevant = [destination for score, _, destination in scored[:limit] if score < 0]
+    return relevant or [scored[0][2]]
+
+
+def format_examples(examples):
+    """Returns destination examples as the "- Name: description" lines used in the templates."""
+    return "\n".join(f"    - {d['name']}: {d['text']}" for d in examples)
+
+
+class PromptAssembler:
+    """Builds prompts as a static prefix, a selected-examples section and the dynamic fields.
+
+    `template` contains one "{examples}" placeholder; everything before it must be
+    free of other fields, so that identical prefix stays first in every request and
+    remains eligible for provider-side prompt caching. `baseline_examples` is the
+    examples text the template used to embed in full, against which savings are
+    reported.
+    """
+
+    def __init__(self, encoding, template, baseline_examples):
+        self.encoding = encoding
+        self.template = template
+        self.static_prefix, self.dynamic_template = template.split("{examples}")
+        if "{" in self.static_prefix.replace("{{", "").replace("}}", ""):
+            raise ValueError("The static prefix of a prompt template must not contain fields")
+        self.static_tokens = self.count(self.static_prefix)
+        self.baseline_example_tokens = self.count(baseline_examples)
+
+    def count(self, text):
+        return len(self.encoding.encode(text))
+
+    def assemble(self, examples, **fields):
+        """Returns (prompt, report) where report holds the token count of each section."""
+        dynamic = self.dynamic_template.format(**fields)
+        example_tokens = self.count(examples)
+        dynamic_tokens = self.count(dynamic)
+        total = self.static_tokens + example_tokens + dynamic_tokens
+        report = {
+            "static_prefix": self.static_tokens,
+            "examples": example_tokens,
+            "dynamic": dynamic_tokens,
+            "total": total,
+            "saved": self.baseline_example_tokens - example_tokens,
+        }
+        return self.static_prefix + examples + dynamic, report
+
+
+def format_report(report):
+    return (f"Prompt: {report['total']} tokens (static prefix {report['static_prefix']}, "
+            f"examples {report['examples']}, request {report['dynamic']}); "
+            f"{report['saved']} tokens saved by example selection.")
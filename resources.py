@@ -0,0 +1,103 @@
+import hashlib
+import os
+import threading
+
+import tiktoken
+import yaml
+
+
+class ResourceRegistry:
+    """Process-wide registry of heavyweight objects (clients, chains, tokenizers, indexes).
+
+    Each resource is built lazily by the first caller and then shared by every
+    session and thread. Resources that depend on credentials are dropped and
+    rebuilt on next use when the contents of the credentials file change.
+    """
+
+    def __init__(self, creds_path="creds.yaml"):
+        self.creds_path = creds_path
+        self.lock = threading.Lock()
+        self.build_locks = {}
+        self.resources = {}
+        self.creds_dependent = set()
+        self.creds_mtime = None
+        self.creds_digest = None
+        self.creds_data = None
+
+    def creds(self):
+        """Returns the credentials, reloading them and invalidating dependent resources if the file changed."""
+        mtime = os.stat(self.creds_path).st_mtime_ns
+        with self.lock:
+            if mtime == self.creds_mtime:
+                return self.creds_data
+            with open(self.creds_path, "rb") as f:
+                raw = f.read()
+            digest = hashlib.sha256(raw).hexdigest()
+            if self.creds_digest is not None and digest != self.creds_digest:
+                for name in self.creds_dependent:
+                    self.resources.pop(name, None)
+                self.creds_dependent.clear()
+            self.creds_mtime = mtime
+            self.creds_digest = digest
+            self.creds_data = yaml.safe_load(raw)
+            return self.creds_data
+
+    def get(self, name, build, uses_creds=True):
+        """Returns the resource called `name`, calling `build()` (or `build(creds)`) once to create it."""
+        creds = self.creds() if uses_creds else None
+        with self.lock:
+            if name in self.resources:
+                return self.resources[name]
+            build_lock = self.build_locks.setdefault(name, threading.Lock())
+
+        # Build outside the registry lock so slow builds do not block other resources
+        with build_lock:
+            with self.lock:
+                if name in self.resources:
+                    return self.resources[name]
+            resource = build(creds) if uses_creds else build()
+            with self.lock:
+                self.resources[name] = resource
+                if uses_creds:
+                    self.creds_dependent.add(name)
+            return resource
+
+    def invalidate(self, name=None):
+        """Drops one resource, or all of them, so they are rebuilt on next use."""
+        with self.lock:
+            if name is None:
+                self.resources.clear()
+                self.creds_dependent.clear()
+            else:
+                self.resources.pop(name, None)
+                self.creds_dependent.discard(name)
+
+
+REGISTRY = ResourceRegistry()
+
+
+def load_creds():
+    """Returns the contents of creds.yaml, reloaded only when the file changes."""
+    return REGISTRY.creds()
+
+
+def export_creds(config, environ=os.environ):
+    """Copies the creds.yaml values into the environment as strings.
+
+    YAML reads values such as `METRICS_PORT: 9464` or `SHOW_METRICS: true` as
+    int and bool, which os.environ does not accept; empty values are skipped.
+    """
+    for key, value in config.items():
+        if value is not None:
+            environ[key] = str(value)
+
+
+def get_encoding(encoding_name):
+    """Returns the shared tiktoken encoding with the given name."""
+    return REGISTRY.get(f"encoding:{encoding_name}", lambda: tiktoken.get_encoding(encoding_name), uses_creds=False)
+
+
+def get_encoding_for_model(model_name):
+    """Returns the shared tiktoken encoding used by the given model."""
+    return REGISTRY.get(f"encoding_for_model:{model_name}", lambda: tiktoken.encoding_for_model(model_name),
+                        uses_creds=False)
@@ -0,0 +1,147 @@
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import openai
+from langchain.docstore.document import Document
+
+from metrics import METRICS
+
+
+def openai_embed_batch(texts, engine="text-embedding-ada-002"):
+    """Embeds a list of texts with a single OpenAI request, returning vectors in input order."""
+    response = openai.Embedding.create(input=texts, engine=engine)
+    return [item["embedding"] for item in sorted(response["data"], key=lambda item: item["index"])]
+
+
+class QueryEmbedder:
+    """LRU-cached query embeddings; the misses of a batch are embedded in one request."""
+
+    def __init__(self, embed_batch=openai_embed_batch, max_entries=4096):
+        self.embed_batch = embed_batch
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.vectors = OrderedDict()
+
+    def embed_many(self, queries):
+        with self.lock:
+            found = {q: self.vectors[q] for q in queries if q in self.vectors}
+        misses = list(dict.fromkeys(q for q in queries if q not in found))
+        METRICS.count("cache.requests", len(queries) - len(misses), cache="embedding", result="hit")
+        if misses:
+            METRICS.count("cache.requests", len(misses), cache="embedding", result="miss")
+            with METRICS.span("embedding.request"):
+                found.update(zip(misses, self.embed_batch(misses)))
+        with self.lock:
+            for query in dict.fromkeys(queries):
+                self.vectors[query] = found[query]
+                self.vectors.move_to_end(query)
+            while len(self.vectors) > self.max_entries:
+                self.vectors.popitem(last=False)
+        return [found[q] for q in queries]
+
+    def embed(self, query):
+        return self.embed_many([query])[0]
+
+
+def match_to_document(match, text_key="text"):
+    metadata = dict(match.get("metadata") or {})
+    text = metadata.pop(text_key, "")
+    metadata["score"] = match.get("score")
+    return Document(page_content=text, metadata=metadata)
+
+
+class Retriever:
+    """Embeds queries and fetches the top_k matching contexts from a vector index.
+
+    `index` is a pinecone.Index, or anything with the same `query` signature.
+    Several queries are embedded with one request and looked up with one
+    multi-vector query.
+    """
+
+    def __init__(self, index, embedder, top_k=5, text_key="text"):
+        self.index = index
+        self.embedder = embedder
+        self.top_k = top_k
+        self.text_key = text_key
+
+    def retrieve_many(self, queries, filter=None):
+        """Returns one list of Documents per query."""
+        vectors = self.embedder.embed_many(queries)
+        with METRICS.span("retrieval.query"):
+            if len(vectors) == 1:
+                response = self.index.query(vector=vectors[0], top_k=self.top_k, include_metadata=True, filter=filter)
+                results = [response]
+            else:
+                response = self.index.query(queries=vectors, top_k=self.top_k, include_metadata=True, filter=filter)
+                results = response["results"]
+        return [[match_to_document(m, self.text_key) for m in result["matches"]] for result in results]
+
+    def retrieve(self, query, filter=None):
+        return self.retrieve_many([query], filter=filter)[0]
+
+
+class RetrievalBatcher:
+    """Groups queries submitted concurrently (e.g. by several sessions) into one retrieval call.
+
+    A batch is sent when it reaches `max_batch` queries or `max_wait` seconds after
+    its first query arrived, whichever comes first.
+    """
+
+    def __init__(self, retriever, max_batch=16, max_wait=0.02):
+        self.retriever = retriever
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.pending = []
+        self.timer = None
+
+    def submit(self, query, filter=None):
+        """Returns a Future resolving to the query's list of Documents."""
+        future = Future()
+        batch = None
+        with self.lock:
+            self.pending.append((query, filter, future))
+            if len(self.pending) >= self.max_batch:
+                batch = self._take()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.max_wait, self._flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if batch:
+            self._run(batch)
+        return future
+
+    def retrieve(self, query, filter=None):
+        return self.submit(query, filter).result()
+
+    def _take(self):
+        batch, self.pending = self.pending, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return batch
+
+    def _flush(self):
+        with self.lock:
+            batch = self._take()
+        if batch:
+            self._run(batch)
+
+    def _run(self, batch):
+        # Queries can only share an index query if they use the same metadata filter
+        groups = {}
+        for query, filter, future in batch:
+            key = json.dumps(filter, sort_keys=True)
+            groups.setdefault(key, (filter, []))[1].append((query, future))
+        for filter, items in groups.values():
+            queries = list(dict.fromkeys(query for query, _ in items))
+            try:
+                results = dict(zip(queries, self.retriever.retrieve_many(queries, filter=filter)))
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            for query, future in items:
+                future.set_result(results[query])
@@ -0,0 +1,269 @@
+import heapq
+import itertools
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from metrics import METRICS
+from resources import REGISTRY
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+# Completion tokens reserved for a request that does not set max_tokens (OpenAI's default)
+DEFAULT_COMPLETION_TOKENS = 256
+# Seconds all requests are held back after the provider answers 429 without a Retry-After header
+RATE_LIMIT_PAUSE = 5.0
+
+_local = threading.local()
+
+
+@contextmanager
+def priority(level):
+    """Runs the block's scheduled requests at the given priority, such as BACKGROUND for warm-up work."""
+    previous = current_priority()
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority():
+    return getattr(_local, "priority", INTERACTIVE)
+
+
+def completion_budget(params):
+    """Returns the completion tokens a request may use, from its max_tokens."""
+    max_tokens = params.get("max_tokens")
+    return max_tokens if max_tokens and max_tokens > 0 else DEFAULT_COMPLETION_TOKENS
+
+
+class SchedulerSaturated(Exception):
+    """Raised instead of queueing a request that could not start within the scheduler's limits."""
+
+
+def _retry_after(error):
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after") or headers.get("Retry-After") or RATE_LIMIT_PAUSE)
+    except (TypeError, ValueError):
+        return RATE_LIMIT_PAUSE
+
+
+def _take(state, limits, period, cost, now):
+    """Refills the buckets and takes `cost` from them, returning 0, or the seconds until it would fit."""
+    for i, limit in enumerate(limits):
+        state["levels"][i] = min(limit, state["levels"][i] + (now - state["updated"]) * limit / period)
+    state["updated"] = now
+    if cost is None:
+        return 0.0
+    if now < state["paused_until"]:
+        return state["paused_until"] - now
+    waits = [(c - level) * period / limit for c, level, limit in zip(cost, state["levels"], limits) if level < c]
+    if waits:
+        return max(waits)
+    state["levels"] = [level - c for level, c in zip(state["levels"], cost)]
+    return 0.0
+
+
+class MemoryState:
+    """Bucket levels held by this process."""
+
+    def __init__(self, limits):
+        self.lock = threading.Lock()
+        self.state = {"levels": list(limits), "updated": time.time(), "paused_until": 0.0}
+
+    def update(self, fn):
+        with self.lock:
+            return fn(self.state)
+
+
+class FileState:
+    """Bucket levels kept in a JSON file behind an exclusive file lock, shared by every process using it."""
+
+    def __init__(self, path, limits):
+        self.path = path
+        self.limits = limits
+        self.lock = threading.Lock()
+
+    def update(self, fn):
+        import fcntl
+
+        with self.lock, open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                raw = f.read()
+                state = json.loads(raw) if raw else {"levels": list(self.limits), "updated": time.time(),
+                                                     "paused_until": 0.0}
+                result = fn(state)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Scheduler:
+    """Meters OpenAI requests and their estimated tokens per minute across the sessions of a process.
+
+    Callers wait in one queue ordered by priority, then arrival, and only the
+    head of the queue takes from the buckets, so interactive requests start
+    before background ones and waiting requests are released one by one
+    instead of retrying in lockstep. A request is rejected at once with
+    SchedulerSaturated when the queue already holds `max_queue` requests, or
+    when those of the same or higher priority could not all start within
+    `max_wait` seconds. With `lock_path`, the buckets are kept in that file and
+    shared by every process that uses the same path.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None, max_queue=64, max_wait=30.0,
+                 lock_path=None, period=60.0):
+        self.enabled = bool(requests_per_minute or tokens_per_minute)
+        self.limits = (float(requests_per_minute or math.inf), float(tokens_per_minute or math.inf))
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.period = period
+        self.state = FileState(lock_path, self.limits) if lock_path else MemoryState(self.limits)
+        self.condition = threading.Condition()
+        self.queue = []
+        self.order = itertools.count()
+        self.rejected = 0
+
+    @classmethod
+    def from_config(cls, config):
+        """Builds the scheduler from the OPENAI_* limits in creds.yaml; without limits it never waits.
+
+        YAML gives the limits as numbers, but strings (e.g. from the environment) are accepted too.
+        """
+        def number(key, default=None):
+            value = config.get(key)
+            return default if value is None or value == "" else float(value)
+
+        lock_path = config.get("OPENAI_RATE_LOCK_FILE")
+        return cls(requests_per_minute=number("OPENAI_REQUESTS_PER_MINUTE"),
+                   tokens_per_minute=number("OPENAI_TOKENS_PER_MINUTE"),
+                   max_queue=int(number("OPENAI_QUEUE_DEPTH", 64)),
+                   max_wait=number("OPENAI_MAX_WAIT", 30.0),
+                   lock_path=str(lock_path) if lock_path else None)
+
+    def _reject(self, reason, message):
+        self.rejected += 1
+        METRICS.count("scheduler.rejected", reason=reason)
+        raise SchedulerSaturated(message)
+
+    def _estimated_wait(self, level, tokens):
+        """Seconds until the queued requests of the same or higher priority and this one could all start."""
+        ahead = [entry for entry in self.queue if entry[0] <= level]
+        cost = (len(ahead) + 1, sum(entry[2] for entry in ahead) + tokens)
+
+        def levels_now(state):
+            _take(state, self.limits, self.period, None, time.time())
+            return list(state["levels"])
+
+        levels = self.state.update(levels_now)
+        return max(0.0, *((c - available) * self.period / limit
+                          for c, available, limit in zip(cost, levels, self.limits)))
+
+    def acquire(self, tokens, level=None):
+        """Waits until one request of `tokens` estimated tokens fits in the limits, then takes it."""
+        if not self.enabled:
+            return
+        level = current_priority() if level is None else level
+        if tokens > self.limits[1]:
+            self._reject("too_large", f"The request needs about {tokens} tokens, more than the "
+                                      f"{self.limits[1]:.0f} tokens per minute allowed.")
+        with self.condition:
+            if len(self.queue) >= self.max_queue:
+                self._reject("queue_full", f"Too many requests are waiting for the model ({len(self.queue)}); "
+                                           f"please try again in a moment.")
+            wait = self._estimated_wait(level, tokens)
+            if wait > self.max_wait:
+                self._reject("too_slow", f"The model is busy: this request would wait about {wait:.0f}s; "
+                                         f"please try again in a moment.")
+            entry = [level, next(self.order), tokens]
+            heapq.heappush(self.queue, entry)
+            # A request of higher priority may now be at the head
+            self.condition.notify_all()
+            try:
+                while True:
+                    wait = None
+                    if self.queue[0] is entry:
+                        wait = self.state.update(
+                            lambda state: _take(state, self.limits, self.period, (1, tokens), time.time()))
+                        if wait == 0:
+                            heapq.heappop(self.queue)
+                            return
+                        # Other processes may take from shared buckets, so look again at least every second
+                        wait = min(wait, 1.0)
+                    self.condition.wait(wait)
+            finally:
+                if entry in self.queue:
+                    self.queue.remove(entry)
+                    heapq.heapify(self.queue)
+                self.condition.notify_all()
+
+    def settle(self, estimated, actual):
+        """Returns the tokens a finished request reserved but did not use."""
+        if not self.enabled or actual >= estimated:
+            return
+
+        def refund(state):
+            state["levels"][1] = min(self.limits[1], state["levels"][1] + estimated - actual)
+
+        self.state.update(refund)
+        with self.condition:
+            self.condition.notify_all()
+
+    def pause(self, seconds):
+        """Holds back every request for `seconds`, such as after the provider answered 429."""
+        def hold(state):
+            state["paused_until"] = max(state["paused_until"], time.time() + seconds)
+
+        self.state.update(hold)
+
+    def run(self, tokens, fn, level=None, count_tokens=None):
+        """Calls fn() once a request of `tokens` estimated tokens fits in the limits, and returns its result.
+
+        `count_tokens(result)`, if given, returns the tokens the request actually
+        used, and the unused part of the estimate is given back.
+        """
+        level = current_priority() if level is None else level
+        start = time.perf_counter()
+        self.acquire(tokens, level)
+        METRICS.observe("scheduler.wait", time.perf_counter() - start, priority=PRIORITY_NAMES.get(level, level))
+        try:
+            result = fn()
+        except Exception as error:
+            # openai.error.RateLimitError; matched by name so the scheduler does not depend on the client
+            if type(error).__name__ == "RateLimitError":
+                METRICS.count("scheduler.upstream_rate_limited")
+                self.pause(_retry_after(error))
+            raise
+        if count_tokens is not None:
+            self.settle(tokens, count_tokens(result))
+        return result
+
+    def stats(self):
+        with self.condition:
+            return {"queued": len(self.queue), "rejected": self.rejected}
+
+
+def build_scheduler(config):
+    """Builds the scheduler from the loaded creds.yaml dict and registers its queue gauge."""
+    scheduler = Scheduler.from_config(config)
+    METRICS.gauge("scheduler.queued", lambda: scheduler.stats()["queued"])
+    return scheduler
+
+
+def shared_scheduler():
+    """Returns the process-wide OpenAI scheduler, rebuilt when the limits in creds.yaml change.
+
+    The limits are read from `load_creds()` through the registry, not from the exported environment.
+    """
+    return REGISTRY.get("openai.scheduler", build_scheduler)
@@ -0,0 +1,64 @@
+import threading
+from concurrent.futures import Future
+
+# Result handed to the waiting callers when the call was interrupted, telling them to retry
+_ABANDONED = object()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one call.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for it and receive the same result (or exception). Once the
+    call finishes the key is released, so later calls run again — pair this with
+    a cache to also reuse finished results. If the first caller is interrupted
+    instead (KeyboardInterrupt, a Streamlit rerun), the interrupt stays on its
+    own thread and the waiting callers retry.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        """Returns fn(), or the result of the call already in flight for `key`."""
+        while True:
+            with self.lock:
+                future = self.in_flight.get(key)
+                leader = future is None
+                if leader:
+                    future = self.in_flight[key] = Future()
+                    self.calls += 1
+                else:
+                    self.shared += 1
+            if leader:
+                break
+            result = future.result()
+            if result is not _ABANDONED:
+                return result
+            with self.lock:
+                self.shared -= 1
+
+        try:
+            result = fn()
+        except Exception as e:
+            self._release(key)
+            future.set_exception(e)
+            raise
+        except BaseException:
+            self._release(key)
+            future.set_result(_ABANDONED)
+            raise
+        self._release(key)
+        future.set_result(result)
+        return result
+
+    def _release(self, key):
+        with self.lock:
+            del self.in_flight[key]
+
+    def stats(self):
+        with self.lock:
+            return {"calls": self.calls, "shared": self.shared, "in_flight": len(self.in_flight)}
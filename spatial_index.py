@@ -0,0 +1,83 @@
+import numpy as np
+
+from places_store import GRID_DEGREES, gather_csr
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+# Half the Earth's circumference: a circle this large covers every point
+MAX_RADIUS_KM = np.pi * EARTH_RADIUS_KM
+
+
+def haversine_km(lat, lon, latitudes, longitudes):
+    """Returns the great-circle distances in km from (lat, lon) to each of the points."""
+    lat, lon = np.radians(lat), np.radians(lon)
+    latitudes, longitudes = np.radians(latitudes), np.radians(longitudes)
+    a = np.sin((latitudes - lat) / 2) ** 2 + np.cos(lat) * np.cos(latitudes) * np.sin((longitudes - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpatialIndex:
+    """Radius and nearest-neighbour queries over the located places, using the store's grid.
+
+    A radius query gathers the rows of the grid cells overlapping the circle's
+    bounding box and keeps those within the radius by haversine distance, so it
+    only touches the places around the point. Rows come back sorted, which is
+    rating order.
+    """
+
+    def __init__(self, store):
+        self.latitudes = store.arrays["latitude"]
+        self.longitudes = store.arrays["longitude"]
+        self.cells = store.arrays["grid.cells"]
+        self.offsets = store.arrays["grid.offsets"]
+        self.rows = store.arrays["grid.rows"]
+        self.columns = int(np.ceil(360 / GRID_DEGREES))
+
+    def _candidates(self, lat, lon, radius_km):
+        """Returns the rows of the occupied cells overlapping the bounding box of the circle."""
+        lat_extent = radius_km / KM_PER_DEGREE
+        # Degrees of longitude shrink towards the poles, so size the box for its widest latitude
+        cos_lat = np.cos(np.radians(min(abs(lat) + lat_extent, 90.0)))
+        lon_extent = radius_km / (KM_PER_DEGREE * cos_lat) if cos_lat > 1e-9 else 360.0
+        lat_first = int(np.floor((max(lat - lat_extent, -90.0) + 90) / GRID_DEGREES))
+        lat_last = int(np.floor((min(lat + lat_extent, 90.0) + 90) / GRID_DEGREES))
+        n_lon = min(int(np.floor((lon + lon_extent + 180) / GRID_DEGREES))
+                    - int(np.floor((lon - lon_extent + 180) / GRID_DEGREES)) + 1, self.columns)
+        if (lat_last - lat_first + 1) * n_lon > len(self.cells):
+            # The box spans more cells than are occupied: every located row is a candidate
+            return np.asarray(self.rows)
+        lon_first = int(np.floor((lon - lon_extent + 180) / GRID_DEGREES))
+        # Cells past the antimeridian wrap around
+        lon_cells = (lon_first + np.arange(n_lon)) % self.columns
+        keys = (np.arange(lat_first, lat_last + 1)[:, None] * self.columns + lon_cells[None, :]).ravel()
+        found = np.searchsorted(self.cells, keys)
+        occupied = found < len(self.cells)
+        occupied[occupied] = self.cells[found[occupied]] == keys[occupied]
+        return gather_csr(self.offsets, self.rows, found[occupied])
+
+    def within(self, lat, lon, radius_km):
+        """Returns (rows, distances in km) of the places within radius_km of (lat, lon), rows sorted."""
+        rows = self._candidates(lat, lon, radius_km)
+        distances = haversine_km(lat, lon, self.latitudes[rows], self.longitudes[rows])
+        inside = distances <= radius_km
+        rows, distances = rows[inside], distances[inside]
+        order = np.argsort(rows)
+        return rows[order], distances[order]
+
+    def nearest(self, lat, lon, k, select=None):
+        """Returns (rows, distances in km) of the k places nearest to (lat, lon), nearest first.
+
+        `select`, if given, maps candidate rows to the subset to keep, such as
+        the rows of some types. The search radius doubles until k places are found.
+        """
+        radius_km = GRID_DEGREES * KM_PER_DEGREE
+        while True:
+            rows, distances = self.within(lat, lon, radius_km)
+            if select is not None:
+                keep = np.isin(rows, select(rows), assume_unique=True)
+                rows, distances = rows[keep], distances[keep]
+            # Every place within the radius has been seen, so the k nearest of them are the k nearest overall
+            if len(rows) >= k or radius_km >= MAX_RADIUS_KM:
+                order = np.argsort(distances, kind="stable")[:k]
+                return rows[order], distances[order]
+            radius_km *= 2
@@ -0,0 +1,87 @@
+import time
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+
+class StreamTimer:
+    """Measures time to first token and total time of one streamed completion."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.end = None
+
+    def token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+
+    def finish(self):
+        self.end = time.perf_counter()
+
+    @property
+    def ttft(self):
+        return None if self.first_token is None else self.first_token - self.start
+
+    @property
+    def total(self):
+        return None if self.end is None else self.end - self.start
+
+
+class StreamlitTokenHandler(BaseCallbackHandler):
+    """LangChain callback that renders streamed tokens into Streamlit placeholders.
+
+    Each LLM call made while the handler is attached renders into the next
+    placeholder, so the stages of a SequentialChain each get their own slot and
+    a stage starts rendering as soon as its first token arrives.
+    """
+
+    def __init__(self, *placeholders, names=None):
+        self.placeholders = list(placeholders)
+        self.names = list(names) if names else [f"Stage {i + 1}" for i in range(len(placeholders))]
+        self.texts = []
+        self.timers = []
+
+    def _stage(self):
+        return min(len(self.timers), len(self.placeholders)) - 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.texts.append("")
+        self.timers.append(StreamTimer())
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.timers[-1].token()
+        self.texts[-1] += token
+        self.placeholders[self._stage()].markdown(self.texts[-1] + "▌")
+
+    def on_llm_end(self, response, **kwargs):
+        self.timers[-1].finish()
+        self.placeholders[self._stage()].markdown(self.texts[-1])
+
+    def latency_report(self):
+        """Returns one line per stage with its time to first token and total time."""
+        if not self.timers:
+            return "Served from cache."
+        lines = []
+        for name, timer in zip(self.names, self.timers):
+            ttft = f"{timer.ttft:.2f} s" if timer.ttft is not None else "n/a"
+            total = f"{timer.total:.2f} s" if timer.total is not None else "n/a"
+            lines.append(f"{name}: first token {ttft}, total {total}")
+        return "  \n".join(lines)
+
+
+class JSONStreamHandler(BaseCallbackHandler):
+    """LangChain callback that feeds streamed tokens into an IncrementalJSONParser."""
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.timer = None
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.timer = StreamTimer()
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.timer.token()
+        self.parser.feed(token)
+
+    def on_llm_end(self, response, **kwargs):
+        self.timer.finish()
@@ -3,23 +3,34 @@ from langchain import PromptTemplate
 from langchain.llms import OpenAI
 import openai
 from langchain.chains import LLMChain
-import folium
 import streamlit as st
-from streamlit_folium import folium_static
-import yaml
-
-with open("creds.yaml", "r") as f:
-    config = yaml.safe_load(f)
+from resources import REGISTRY, get_encoding_for_model, load_creds
+from destinations import DESTINATIONS
+from prompt_assembly import PromptAssembler, format_examples, format_report, select_examples
+from streaming import StreamlitTokenHandler
+from llm_cache import COMPLETION_CACHE, cached_predict
+from places_index import PlacesIndex
+from geocoding import GeocodeCache
+from map_render import places_map_html, show_map_html
+from metrics import METRICS, configure, sidebar_panel
+from jobs import checkpoint, poll, session_jobs
+from scheduler import SchedulerSaturated
+
+config = load_creds()
+
+# Start the metrics exporters enabled in creds.yaml
+configure(config)
 
 openai_api_key = config['OPENAI_API_KEY']
 
+# The static instructions come first and are identical in every request, so providers can cache them;
+# the examples are selected per request and the trip details come last
 template = """
     Your purpose is to provide a travel itinerary.
     Below you find instructions for your purpose.
 
-    - Make a daily plan for a trip in the {location} for {duration} days.
-    - Daily plan needs to entail a places based on user's preferred {filters}.
-    - These places are filtered from a pandas dataframe with the following columns: {filters}, {location}.
+    - Make a daily plan for a trip to the location below, for the given number of days.
+    - Daily plan needs to entail places based on the user's preferred filters below.
     - Mention these places in the daily itineraries.
     
     Here are some examples of daily itineraries:
@@ -38,13 +49,11 @@ template = """
         You can rent a bike and go around the island.
 
     Here are examples of summaries for different locations:
-    - Amorgos: Amorgos is a paradise for explorers, divers, and hikers. Its small bays, mountain paths and all-white churches, make it the ideal destination for an alternative Cycladic holiday. You should visit Ammos AMORGOS, a beach bar with a great view of the sea and the sunset. 
-    - Catania: Catania in Sicily has a long history in a picturesque scene. With Aetna on its backdrop it offers a lot to lovers of Nature. Moreover, it's on the water and has beautiful beaches with turquoise waters. Visit Villa Bellini, a beautiful park in the heart of the city.
-    - Samothrace: Samothrace in the north east Aegean is famed for its wild mountain, Saos, that towers on the island and attracts travelers who prefer alternative types of tourism beyond the standard Greek island beach vibes (which if you wish, you can also indulge in here). Mount Saos is the highest mountain in the Aegean and its gorges, forests and waterfalls make for great exploring and action. Its peak, called Fegari (Moon), is at an impressive and panoramic height of 1.611 metres (5,285ft) and according to Homer, is where Poseidon watched the Achaeans, led by King Agamemnon, besiege Troy.
-    - Epidaurus: Ancient Epidaurus is a must for lovers of culture. Not just one of the most significant archaeological sites in Greece, but also a place that has managed to become a travel destination by preserving its ancient identity, keeping its theatre in operation, and hosting dozens of shows each year.
-    - Paros: Paros has a healthy art scene with numerous galleries and public spaces given over to exhibitions. Paros Park hosts a series of summer events, such as concerts in the amphitheatre and films under the stars at Cine Enastron. Also in summer, a week never seems to pass without some celebration or feast day. 
-    - Samos: Experience Samos and its vibrant nightlife, a North Aegean Island in Greece. An array of bars caters to diverse tastes. From sophisticated artistic soirees to lively waterfront dance parties and themed nights, Samos offers a unique blend of ambiance and entertainment. In Iera Odos, an establishment exuding class, you’ll find erudite crowds drawn to its intellectual ambiance, artistic events, and live music. 
-    - Mykonos: Mykonos is perhaps the epicenter of nightlife in Greece and for a good reason. Savor a selection of Mykonos’s finest Greek wines during a wine-tasting tour. Visit the island’s most famous beaches, including Super Paradise, Paradise, and Paraga.
+{examples}
+
+    Location: {location}
+    Duration: {duration} days
+    Filters: {filters}
 
     Please start with a summary for the {location} followed by the daily plan.
 
@@ -56,54 +65,50 @@ template = """
 """
 
 prompt = PromptTemplate(
-    input_variables=["location","filters","duration"],
+    input_variables=["location","filters","duration","examples"],
     template=template,
 )
 
-data=pd.read_csv('places_greece.csv')
-
-def generate_map(location, filters, duration=5):
-    # Filter the data based on the location
-    filtered_data = data[data["place_address"].str.contains(location, case=False)]
-
-    # Filter the data based on the has_type values
-    filtered_data.loc[:, "has_type"] = filtered_data["has_type"].fillna("").astype(str)
-    filtered_data = filtered_data[filtered_data["has_type"].apply(lambda x: any(f in x.split(', ') for f in filters))]
+def build_assembler():
+    # Savings are measured against all the summaries the template used to include
+    return PromptAssembler(get_encoding_for_model("text-davinci-003"), template, format_examples(DESTINATIONS))
 
-    # Sort the filtered data based on the rating
-    sorted_data = filtered_data.sort_values(by="rating", ascending=False)
+@st.cache_resource
+def load_places_index():
+    # Build the places index once per process instead of scanning the CSV on every rerun
+    return PlacesIndex.from_csv('places_greece.csv')
 
-    # Select the top-rated places based on the duration of the trip (e.g., 5 places per day)
-    selected_places = sorted_data.head(duration * 2)
-
-    # Get the latitude and longitude of the first result to center the map
-    center_lat, center_lng = selected_places.iloc[0]["latitude"], selected_places.iloc[0]["longitude"]
+places = load_places_index()
 
-    # Create a map centered on the location
-    m = folium.Map(location=[center_lat, center_lng], zoom_start=12)
+# Places within this distance of the geocoded location are candidates for the map, widened when too few match
+SEARCH_RADIUS_KM = 25
 
-    # Add markers for the selected places
-    for _, row in selected_places.iterrows():
-        folium.Marker(
-            location=[row["latitude"], row["longitude"]],
-            popup=f"{row['place_name']} ({row['rating']})",
-        ).add_to(m)
+@st.cache_resource
+def load_geocoder():
+    # One persistent geocoding cache per process, shared by all sessions
+    return GeocodeCache()
 
-    return m
+def generate_map(location, filters, duration=5):
+    # Places whose address names the location, or around its geocoded point, since addresses may not name
+    # the town; regions and islands wider than the radius are covered by their addresses
+    point = load_geocoder().resolve(location)
+    # Select the top-rated places based on the duration of the trip (e.g., 5 places per day)
+    with METRICS.span("map.filter"):
+        selected_places = places.top_places_around(location, point, SEARCH_RADIUS_KM, filters, duration * 2)
+    # The rendered HTML is cached, so reruns showing the same places skip building the map
+    return places_map_html(selected_places)
 
-def extract_unique_filters(data):
-    all_filters = set()
-    for types in data["has_type"].dropna().astype(str):
-        all_filters.update(types.split(', '))
-    return sorted(list(all_filters))
+def build_chain(config):
+    llm = OpenAI(temperature=0, openai_api_key=config['OPENAI_API_KEY'], streaming=True)
+    return LLMChain(llm=llm, prompt=prompt)
 
-def load_LLM(location,filters,duration):
+def load_LLM(location,filters,duration,examples,handler=None):
     """Logic for loading the chain you want to use should go here."""
     # Make sure your openai_api_key is set as an environment variable
-    llm = OpenAI(temperature=0, openai_api_key=openai_api_key)
-    chain = LLMChain(llm=llm, prompt=prompt)
+    chain = REGISTRY.get("test.itinerary_chain", build_chain)
     # inputs = {"location": location, "filters": filters, "duration": duration}
-    results = chain.predict(location=location, filters=filters, duration=duration, max_length=1000, num_return_sequences=1)
+    # Stream tokens to the handler, if any, as they are generated
+    results = cached_predict(COMPLETION_CACHE, chain, callbacks=[handler] if handler else None, location=location, filters=filters, duration=duration, examples=examples, max_length=1000, num_return_sequences=1)
     return results
 
 # Streamlit app
@@ -111,13 +116,56 @@ st.title("Trip Planner")
 
 # User input
 location = st.text_input("Enter the location (e.g., Rhodes, Greece):")
-unique_filters = extract_unique_filters(data)
-filters = st.multiselect("Select filters:", unique_filters)
+# Only the types found in the location are offered, with the number of places of each
+filter_options, filter_counts = places.facets.options(location)
+
+def remember_filters():
+    st.session_state["selected_filters"] = st.session_state["filters"]
+
+# Editing the location changes the options, and with them the widget; the selection is carried over
+# to the new one, keeping the types that are still offered
+kept_filters = [t for t in st.session_state.get("selected_filters", []) if t in filter_counts]
+filters = st.multiselect("Select filters:", filter_options, default=kept_filters, key="filters",
+                         on_change=remember_filters,
+                         help="Places of each type: " + ", ".join(f"{t} {filter_counts[t]}" for t in filter_options))
 duration = st.number_input("Enter the duration of the trip in days:", min_value=1, value=5)
 
 if location and filters:
-    m = generate_map(location, filters, duration)
-    folium_static(m)
-
-    itinerary = load_LLM(location, filters, duration)
-    st.write(itinerary)
\ No newline at end of file
+    # The map and itinerary run in the background; changing an input supersedes them instead of waiting
+    jobs = session_jobs()
+    inputs = (location, tuple(filters), duration)
+
+    def build_map(job):
+        with METRICS.span("map.build"):
+            return generate_map(location, filters, duration)
+
+    def plan(job):
+        handler = StreamlitTokenHandler(job.slot("itinerary"), names=["Itinerary"])
+        # Only the summaries relevant to the location and filters are included in the prompt
+        examples = format_examples(select_examples(location=location, interests=" ".join(filters)))
+        _, prompt_report = REGISTRY.get("test.prompt_assembler", build_assembler, uses_creds=False).assemble(
+            examples, location=location, filters=filters, duration=duration)
+        checkpoint()
+        itinerary = load_LLM(location, filters, duration, examples, handler)
+        return itinerary, handler.latency_report(), format_report(prompt_report)
+
+    map_job = jobs.submit("map", inputs, build_map)
+    itinerary_job = jobs.submit("itinerary", inputs, plan)
+
+    status = st.empty()
+    m = poll(map_job, status=status)
+    with METRICS.span("map.render"):
+        show_map_html(m)
+
+    placeholder = st.empty()
+    try:
+        itinerary, latency_report, prompt_report = poll(itinerary_job, {"itinerary": placeholder}, status)
+    except SchedulerSaturated as e:
+        # Too many requests are waiting for the model; the next rerun submits the itinerary again
+        placeholder.warning(str(e))
+    else:
+        placeholder.write(itinerary)
+        st.caption(latency_report)
+        st.caption(prompt_report)
+
+sidebar_panel(config)
\ No newline at end of file
@@ -5,7 +5,10 @@ from langchain.llms import OpenAI
 import folium
 import streamlit as st
 from streamlit_folium import folium_static
-import yaml
+from resources import REGISTRY, load_creds
+from llm_cache import scheduled_predict
+from scheduler import SchedulerSaturated
+from metrics import configure, sidebar_panel
 import requests
 
 st.title("Dynamic Weather Map")
@@ -45,22 +48,39 @@ st.components.v1.html(html_code,height=1000, scrolling=True)
 # map = st_leaflet_map(center=center, zoom=zoom, layers=[weather_layer])
 
 
-with open("creds.yaml", "r") as f:
-    config = yaml.safe_load(f)
+config = load_creds()
+
+# Start the metrics exporters enabled in creds.yaml
+configure(config)
 
 openai_api_key = config['OPENAI_API_KEY']
 
+def build_chain(config):
+    llm = OpenAI(temperature=0,openai_api_key=config['OPENAI_API_KEY'],max_tokens=150,model_name="text-davinci-003")
+    return APIChain.from_llm_and_api_docs(llm, open_meteo_docs.OPEN_METEO_DOCS, verbose=True)
+
 def load_LLM(query):
     """Logic for loading the chain you want to use should go here."""
     # Make sure your openai_api_key is set as an environment variable
-    llm = OpenAI(temperature=0,openai_api_key=openai_api_key,max_tokens=150,model_name="text-davinci-003")
-    chain_new = APIChain.from_llm_and_api_docs(llm, open_meteo_docs.OPEN_METEO_DOCS, verbose=True)
-    results = chain_new.run(query)
+    chain_new = REGISTRY.get("test_kiwi.api_chain", build_chain)
+    # The two steps of APIChain.run, each metered by the OpenAI scheduler from its rendered prompt, which holds
+    # the API docs and, in the second step, the API response; the answer is read from a live forecast, so it
+    # is not cached
+    api_url = scheduled_predict(chain_new.api_request_chain, question=query, api_docs=chain_new.api_docs).strip()
+    api_response = chain_new.requests_wrapper.get(api_url)
+    results = scheduled_predict(chain_new.api_answer_chain, question=query, api_docs=chain_new.api_docs,
+                                api_url=api_url, api_response=api_response)
     return results
 
 # User input
 query = st.text_area("Enter the location and timeframe (e.g., Rhodes, Greece tomorrow)",height=300)
 
 if query:
-    forecast = load_LLM(query)
-    st.write(forecast)
\ No newline at end of file
+    try:
+        forecast = load_LLM(query)
+    except SchedulerSaturated as e:
+        st.warning(str(e))
+    else:
+        st.write(forecast)
+
+sidebar_panel(config)
@@ -2,26 +2,32 @@ import pandas as pd
 from langchain.prompts import PromptTemplate
 from langchain.llms import OpenAI
 from langchain.chains import LLMChain
-import folium
 import streamlit as st
-from streamlit_folium import folium_static
-import yaml
+from resources import REGISTRY, get_encoding, load_creds
+from llm_cache import COMPLETION_CACHE, cached_predict
 import streamlit.config as config
-import tiktoken
-import geocoder
-import json
+from geocoding import GeocodeCache
+from places_index import PlacesIndex
+from concurrent.futures import ThreadPoolExecutor
+from json_stream import ItineraryPlacesParser
+from streaming import JSONStreamHandler
+from map_render import coordinates_map_html, show_map_html
+from metrics import METRICS, configure, sidebar_panel
+from jobs import cancelled, checkpoint, poll, session_jobs
+from scheduler import SchedulerSaturated
 
 config.set_option('server.live_save', True)
 
-with open("creds.yaml", "r") as f:
-    config = yaml.safe_load(f)
+config = load_creds()
+
+# Start the metrics exporters enabled in creds.yaml
+configure(config)
 
 openai_api_key = config['OPENAI_API_KEY']
 
-encoding = tiktoken.get_encoding("p50k_base")
 def num_tokens_from_string(string: str, encoding_name: str) -> int:
     """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding(encoding_name)
+    encoding = get_encoding(encoding_name)
     num_tokens = len(encoding.encode(string))
     return num_tokens
 
@@ -47,44 +53,85 @@ prompt = PromptTemplate(
     template=template,
 )
 
-def get_places(itinerary_):
-    places_dict = {}
-    for day, details in itinerary_.items():
-        for place in details["places"]:
-            try:
-                location = geocoder.osm(place)
-                places_dict[place] = (location.lat, location.lng)
-            except Exception as e:
-                print(e," for place: ", place)
-                continue
-    return places_dict
+@st.cache_resource
+def load_geocoder():
+    # One persistent geocoding cache per process, shared by all sessions
+    return GeocodeCache()
+
+@st.cache_resource
+def load_places_index():
+    # Build the places index once per process instead of scanning the CSV on every rerun
+    index = PlacesIndex.from_csv('places_greece.csv')
+    METRICS.gauge("names.local_hit_rate", lambda: index.names.stats()["hit_rate"])
+    return index
+
+# Places within this distance of the trip's location are the candidates for the itinerary's place names
+NAME_RADIUS_KM = 50
+
+def location_rows(location):
+    """Returns the rows of the places around the location, falling back to those whose address names it."""
+    places_index = load_places_index()
+    point = load_geocoder().resolve(location)
+    if point is not None:
+        rows, _ = places_index.spatial.within(point[0], point[1], NAME_RADIUS_KM)
+        if len(rows):
+            return rows
+    return places_index.location_rows(location)
+
+def get_places(itinerary_, pending=None, rows=None, tally=None):
+    # Places already being resolved while the itinerary streamed in are collected from their futures
+    pending = pending or {}
+    places = [place for details in itinerary_.values() for place in details.get("places", [])]
+    # Names found in the dataset are resolved locally; only the rest are geocoded
+    places_dict = load_places_index().names.resolve_many((p for p in places if p not in pending), load_geocoder(),
+                                                         rows, tally)
+    for place, future in pending.items():
+        if future.result() is not None:
+            places_dict[place] = future.result()
+    return {place: places_dict[place] for place in places if place in places_dict}
 
 def get_map(coordinates):
-    center_lat = sum(coord[0] for coord in coordinates.values()) / len(coordinates)
-    center_lng = sum(coord[1] for coord in coordinates.values()) / len(coordinates)
-
-    # Create a folium Map instance
-    map = folium.Map(location=[center_lat, center_lng], zoom_start=16)
-
-    # Add markers for each place
-    for place, coord in coordinates.items():
-        folium.Marker(location=coord, popup=place).add_to(map)
-
     # Display the map
-    return map
+    return coordinates_map_html(coordinates)
+
+def build_chain(config):
+    llm = OpenAI(temperature=0, openai_api_key=config['OPENAI_API_KEY'], streaming=True)
+    return LLMChain(llm=llm, prompt=prompt)
 
 def load_LLM(location,filters,duration):
     """Logic for loading the chain you want to use should go here."""
     # Make sure your openai_api_key is set as an environment variable
-    llm = OpenAI(temperature=0, openai_api_key=openai_api_key)
-    chain = LLMChain(llm=llm, prompt=prompt)
-    # inputs = {"location": location, "filters": filters, "duration": duration}
-    results = chain.predict(location=location, activities=filters, duration=duration, max_length=1000, num_return_sequences=1)
-    response_data = json.loads(results)
-    itinerary = response_data[0]["itinerary"]
-    places_dict = get_places(itinerary)
+    geocoder = load_geocoder()
+    names = load_places_index().names
+    rows = location_rows(location)
+    pending = {}
+    # Places of this itinerary resolved from the dataset (hits) and geocoded (misses)
+    name_counts = {"hits": 0, "misses": 0}
+
+    with ThreadPoolExecutor(max_workers=geocoder.max_workers) as pool:
+        # Start resolving each place as soon as the model has finished writing it
+        def on_place(day, place):
+            if place not in pending and not cancelled():
+                pending[place] = pool.submit(names.resolve, place, geocoder, rows, name_counts)
+
+        parser = ItineraryPlacesParser(on_place)
+        chain = REGISTRY.get("test_parse_output.itinerary_chain", build_chain)
+        # inputs = {"location": location, "filters": filters, "duration": duration}
+        results = cached_predict(COMPLETION_CACHE, chain, callbacks=[JSONStreamHandler(parser)], location=location, activities=filters, duration=duration, max_length=1000, num_return_sequences=1)
+        if not parser.text:
+            # Served from cache, so nothing was streamed
+            parser.feed(results)
+
+        # Salvage truncated or malformed JSON instead of re-requesting it
+        response_data = parser.recover()
+        if isinstance(response_data, list):
+            response_data = response_data[0]
+        itinerary = response_data["itinerary"]
+        # Inputs changed while the itinerary was generated: skip resolving its places
+        checkpoint()
+        places_dict = get_places(itinerary, pending, rows, name_counts)
     tokencount = num_tokens_from_string(results, encoding_name="p50k_base")
-    return results, tokencount, places_dict
+    return results, tokencount, places_dict, name_counts
 
 # Streamlit app
 st.title("Trip Planner")
@@ -100,8 +147,26 @@ if location and filters:
     # m = generate_map(location, filters, duration)
     # folium_static(m)
 
-    itinerary, tokens, places = load_LLM(location, filters, duration)
-    # st.write(itinerary)
-    st.write("I used the following number of tokens: ", tokens)
-    # st.write(places)
-    folium_static(get_map(places))
+    def plan(job):
+        itinerary, tokens, places, name_counts = load_LLM(location, filters, duration)
+        with METRICS.span("map.build"):
+            return tokens, get_map(places), name_counts
+
+    # Runs in the background; changing an input supersedes it instead of waiting for it
+    try:
+        tokens, m, name_counts = poll(session_jobs().submit("itinerary", (location, tuple(filters), duration), plan), status=st.empty())
+    except SchedulerSaturated as e:
+        # Too many requests are waiting for the model; the next rerun submits the itinerary again
+        st.warning(str(e))
+    else:
+        # st.write(itinerary)
+        st.write("I used the following number of tokens: ", tokens)
+        # This itinerary's places only; the rate across all itineraries is the names.local_hit_rate gauge
+        resolved = name_counts["hits"] + name_counts["misses"]
+        st.caption(f"Place names resolved from the dataset without geocoding: {name_counts['hits']} of {resolved}"
+                   + (f" ({name_counts['hits'] / resolved:.0%})" if resolved else ""))
+        # st.write(places)
+        with METRICS.span("map.render"):
+            show_map_html(m)
+
+sidebar_panel(config)
@@ -1,39 +1,70 @@
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 from langchain import PromptTemplate
 from langchain.llms import OpenAI, LLMChain
-from langchain.chains import SequentialChain
-import folium
 import streamlit as st
-from streamlit_folium import folium_static
-import yaml
-
-with open("creds.yaml", "r") as f:
-    config = yaml.safe_load(f)
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from dag import format_timings, run_dag, stage
+from resources import REGISTRY, get_encoding_for_model, load_creds
+from destinations import DESTINATIONS
+from prompt_assembly import PromptAssembler, format_examples, format_report, select_examples
+from streaming import StreamlitTokenHandler
+from places_index import PlacesIndex
+from geocoding import GeocodeCache
+from map_render import places_map_html, show_map_html
+from metrics import METRICS, configure, sidebar_panel
+from llm_cache import scheduled_predict
+from scheduler import SchedulerSaturated
+
+config = load_creds()
+
+# Start the metrics exporters enabled in creds.yaml
+configure(config)
 
 openai_api_key = config['OPENAI_API_KEY']
-llm = OpenAI(temperature=0, openai_api_key=openai_api_key)
 
+# In every template the static instructions come first and are identical in every request, so providers
+# can cache them; the request's fields come last
 template_places = """
     You are knowledgeable about all places in Greece, such as beaches, mountains, restaurants, bars, museums, and hotels.
-    You need to find places to visit in the given {location} for {duration} days.
+    You need to find places to visit in the location below for the given number of days.
 
     Follow these instructions:
-    - Daily plan needs to entail places based on user's preferred {filters}.
+    - Daily plan needs to entail places based on the user's preferred filters below.
     - No more than 2 restaurants per day should be recommended.
     - There should be at least 1 place to visit per day.
     - Make a list of these places that can be used for querying.
 
+    Location: {location}
+    Duration: {duration} days
+    Filters: {filters}
+
     These are the recommended places for your trip:
 """
 
 prompt_places = PromptTemplate(input_variables=["location", 'duration','filters'], template=template_places)
-places_chain = LLMChain(llm=llm, prompt=prompt_places, output_key="places")
 
-template_itinerary = """
+# The itinerary is written one day at a time, so the days can be generated concurrently with the summary
+template_summary = """
     You are a travel planner.
-    
+
+    Here are examples of summaries for different locations:
+{examples}
+
     The recommended places for your trip are:
     {places}
+
+    Please write a short summary of the trip.
+
+    Summary:
+"""
+
+prompt_summary = PromptTemplate(input_variables=["places", "examples"], template=template_summary)
+
+template_day = """
+    You are a travel planner.
     
     Here are examples of daily itineraries:
 
@@ -50,80 +81,147 @@ template_itinerary = """
         In the morning you will take the metro to Piraeaus for your ferry to Spetses. 
         You can rent a bike and go around the island.
 
-    Here are examples of summaries for different locations:
-    - Amorgos: Amorgos is a paradise for explorers, divers, and hikers. Its small bays, mountain paths and all-white churches, make it the ideal destination for an alternative Cycladic holiday. You should visit Ammos AMORGOS, a beach bar with a great view of the sea and the sunset. 
-    - Catania: Catania in Sicily has a long history in a picturesque scene. With Aetna on its backdrop it offers a lot to lovers of Nature. Moreover, it's on the water and has beautiful beaches with turquoise waters. Visit Villa Bellini, a beautiful park in the heart of the city.
-    - Samothrace: Samothrace in the north east Aegean is famed for its wild mountain, Saos, that towers on the island and attracts travelers who prefer alternative types of tourism beyond the standard Greek island beach vibes (which if you wish, you can also indulge in here). Mount Saos is the highest mountain in the Aegean and its gorges, forests and waterfalls make for great exploring and action. Its peak, called Fegari (Moon), is at an impressive and panoramic height of 1.611 metres (5,285ft).
-
-    Please start with a summary, followed by the daily itinerary.
+    Please write the itinerary of a single day of a {duration} day trip, using these places:
+    {places}
 
-    Daily Itinerary:
+    - Day {day}:
 """
 
-prompt_itinerary = PromptTemplate(input_variables=["places"], template=template_itinerary)
-itinerary_chain = LLMChain(llm=llm, prompt=prompt_itinerary, output_key="itinerary")
+prompt_day = PromptTemplate(input_variables=["places", "duration", "day"], template=template_day)
 
-data=pd.read_csv('places_greece.csv')
+# Cap on the days generated at once, on top of the places, summary and map stages
+MAX_PARALLEL_DAYS = 8
 
-def generate_map(location, filters, duration=5):
-    # Filter the data based on the location
-    filtered_data = data[data["place_address"].str.contains(location, case=False)]
-
-    # Filter the data based on the has_type values
-    filtered_data.loc[:, "has_type"] = filtered_data["has_type"].fillna("").astype(str)
-    filtered_data = filtered_data[filtered_data["has_type"].apply(lambda x: any(f in x.split(', ') for f in filters))]
+def build_assembler():
+    # Savings are measured against the three summaries the template used to include
+    return PromptAssembler(get_encoding_for_model("text-davinci-003"), template_summary,
+                           format_examples(DESTINATIONS[:3]))
 
-    # Sort the filtered data based on the rating
-    sorted_data = filtered_data.sort_values(by="rating", ascending=False)
+def build_chains(config):
+    llm = OpenAI(temperature=0, openai_api_key=config['OPENAI_API_KEY'], streaming=True)
+    return {
+        "places": LLMChain(llm=llm, prompt=prompt_places, output_key="places"),
+        "summary": LLMChain(llm=llm, prompt=prompt_summary, output_key="summary"),
+        "day": LLMChain(llm=llm, prompt=prompt_day, output_key="itinerary"),
+    }
 
-    # Select the top-rated places based on the duration of the trip (e.g., 5 places per day)
-    selected_places = sorted_data.head(duration * 2)
+@st.cache_resource
+def load_places_index():
+    # Build the places index once per process instead of scanning the CSV on every rerun
+    return PlacesIndex.from_csv('places_greece.csv')
 
-    # Get the latitude and longitude of the first result to center the map
-    center_lat, center_lng = selected_places.iloc[0]["latitude"], selected_places.iloc[0]["longitude"]
+places = load_places_index()
 
-    # Create a map centered on the location
-    m = folium.Map(location=[center_lat, center_lng], zoom_start=12)
+# Places within this distance of the geocoded location are candidates for the map, widened when too few match
+SEARCH_RADIUS_KM = 25
 
-    # Add markers for the selected places
-    for _, row in selected_places.iterrows():
-        folium.Marker(
-            location=[row["latitude"], row["longitude"]],
-            popup=f"{row['place_name']} ({row['rating']})",
-        ).add_to(m)
+@st.cache_resource
+def load_geocoder():
+    # One persistent geocoding cache per process, shared by all sessions
+    return GeocodeCache()
 
-    return m
-
-def extract_unique_filters(data):
-    all_filters = set()
-    for types in data["has_type"].dropna().astype(str):
-        all_filters.update(types.split(', '))
-    return sorted(list(all_filters))
-
-def load_LLM(location,filters,duration):
+def generate_map(location, filters, duration=5):
+    # Places whose address names the location, or around its geocoded point, since addresses may not name
+    # the town; regions and islands wider than the radius are covered by their addresses
+    point = load_geocoder().resolve(location)
+    # Select the top-rated places based on the duration of the trip (e.g., 5 places per day)
+    with METRICS.span("map.filter"):
+        selected_places = places.top_places_around(location, point, SEARCH_RADIUS_KM, filters, duration * 2)
+    # The rendered HTML is cached, so reruns showing the same places skip building the map
+    return places_map_html(selected_places)
+
+def split_places(places_text, days):
+    """Splits the recommended places list into one list per day, round robin."""
+    lines = [line.strip().lstrip("-*•").strip() for line in places_text.splitlines()]
+    items = [re.sub(r"^\d+[.)]\s*", "", line) for line in lines if line]
+    if not items:
+        return [places_text.strip()] * days
+    return ["\n    ".join(items[day::days]) or "Free day, no specific places." for day in range(days)]
+
+def load_LLM(location,filters,duration,examples,handlers=None,executor=None):
     """Logic for loading the chain you want to use should go here."""
-    overall_chain = SequentialChain(
-        chains=[places_chain, itinerary_chain],
-        input_variables=["location","filters","duration"],
-        # Here we return multiple variables
-        output_variables=["places", "itinerary"],
-        verbose=True)
-    # inputs = {"location": location, "filters": filters, "duration": duration}
-    results = overall_chain({"location":location, "filters": filters, "duration": duration})
-    return results
+    chains = REGISTRY.get("test_sequential_chain.chains", build_chains)
+    handlers = handlers or {}
+
+    def callbacks(name):
+        # Tokens of each stage are streamed to its own handler as soon as that stage starts generating
+        return [handlers[name]] if name in handlers else None
+
+    # Every stage waits for its turn in the OpenAI scheduler, so the parallel days stay within the rate limits
+    def places_stage(values):
+        return scheduled_predict(chains["places"], callbacks("places"), location=location, duration=duration,
+                                 filters=filters)
+
+    def summary_stage(values):
+        return scheduled_predict(chains["summary"], callbacks("summary"), places=values["places"], examples=examples)
+
+    def day_stage(day):
+        def run(values):
+            day_places = split_places(values["places"], duration)[day - 1]
+            return scheduled_predict(chains["day"], callbacks(f"day {day}"), places=day_places, duration=duration,
+                                     day=day)
+        return run
+
+    stages = [stage("places", places_stage), stage("map", lambda values: generate_map(location, filters, duration)),
+              stage("summary", summary_stage, ["places"])]
+    stages += [stage(f"day {day}", day_stage(day), ["places"]) for day in range(1, duration + 1)]
+    results, timings, wall = run_dag(stages, executor=executor)
+    # Day stages are recorded together so the number of series does not grow with the trip length
+    for name, timing in timings.items():
+        METRICS.observe("stage", timing.duration, stage=name.split()[0])
+    return results, timings, wall
 
 # Streamlit app
 st.title("Trip Planner")
 
 # User input
 location = st.text_input("Enter the location (e.g., Rhodes, Greece):")
-unique_filters = extract_unique_filters(data)
-filters = st.multiselect("Select filters:", unique_filters)
+# Only the types found in the location are offered, with the number of places of each
+filter_options, filter_counts = places.facets.options(location)
+
+def remember_filters():
+    st.session_state["selected_filters"] = st.session_state["filters"]
+
+# Editing the location changes the options, and with them the widget; the selection is carried over
+# to the new one, keeping the types that are still offered
+kept_filters = [t for t in st.session_state.get("selected_filters", []) if t in filter_counts]
+filters = st.multiselect("Select filters:", filter_options, default=kept_filters, key="filters",
+                         on_change=remember_filters,
+                         help="Places of each type: " + ", ".join(f"{t} {filter_counts[t]}" for t in filter_options))
 duration = st.number_input("Enter the duration of the trip in days:", min_value=1, value=5)
 
 if location and filters:
-    m = generate_map(location, filters, duration)
-    folium_static(m)
-
-    itinerary = load_LLM(location, filters, duration)['itinerary']
-    st.write(itinerary)
\ No newline at end of file
+    map_placeholder = st.empty()
+    with st.expander("Recommended places"):
+        places_placeholder = st.empty()
+    summary_placeholder = st.empty()
+    day_placeholders = [st.empty() for _ in range(duration)]
+    handlers = {"places": StreamlitTokenHandler(places_placeholder, names=["Places"]),
+                "summary": StreamlitTokenHandler(summary_placeholder, names=["Summary"])}
+    for day, placeholder in enumerate(day_placeholders, start=1):
+        handlers[f"day {day}"] = StreamlitTokenHandler(placeholder, names=[f"Day {day}"])
+
+    # Only the summaries relevant to the location and filters are included in the summary prompt
+    examples = format_examples(select_examples(location=location, interests=" ".join(filters)))
+    # Stage threads render into the placeholders, so they need this session's script run context
+    ctx = get_script_run_ctx()
+    try:
+        with ThreadPoolExecutor(max_workers=min(duration, MAX_PARALLEL_DAYS) + 3,
+                                initializer=lambda: add_script_run_ctx(threading.current_thread(), ctx)) as executor:
+            results, timings, wall = load_LLM(location, filters, duration, examples, handlers, executor)
+    except SchedulerSaturated as e:
+        st.warning(str(e))
+        st.stop()
+    with map_placeholder.container(), METRICS.span("map.render"):
+        show_map_html(results['map'])
+    places_placeholder.write(results['places'])
+    summary_placeholder.write(results['summary'])
+    for day, placeholder in enumerate(day_placeholders, start=1):
+        placeholder.markdown(f"**Day {day}**\n\n{results[f'day {day}']}")
+    st.caption("  \n".join(handler.latency_report() for handler in handlers.values()))
+    st.caption(format_timings(timings, wall))
+    _, prompt_report = REGISTRY.get("test_sequential_chain.prompt_assembler", build_assembler, uses_creds=False).assemble(
+        examples, places=results['places'])
+    st.caption(format_report(prompt_report))
+
+sidebar_panel(config)
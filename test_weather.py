@@ -2,33 +2,35 @@ import pandas as pd
 from langchain.chains.api import open_meteo_docs
 from langchain.chains import APIChain
 from langchain.llms import OpenAI
-import geocoder
+from geocoding import GeocodeCache
 import streamlit as st
 import pydeck as pdk
-import yaml
-import requests
+from resources import load_creds
+from http_transport import TRANSPORT
+from metrics import METRICS, configure, sidebar_panel
 import streamlit.config as config
 import urllib
 
 config.set_option('server.live_save', True)
 
-with open("creds.yaml", "r") as f:
-    config = yaml.safe_load(f)
+config = load_creds()
+
+# Start the metrics exporters enabled in creds.yaml
+configure(config)
 
 openai_api_key = config['OPENAI_API_KEY']
 openweather_api_key = config['OPENWEATHER_API_KEY']
 # print(openweather_api_key)
 st.title("Dynamic Weather Map")
 
+@st.cache_resource
+def load_geocoder():
+    # One persistent geocoding cache per process, shared by all sessions
+    return GeocodeCache()
+
 def get_location(location):
-    location_dict = {}
-    for l in location:
-        g = geocoder.osm(l)
-        if g.ok:
-            location_dict[l] = g.latlng
-        else:
-            continue
-    return location_dict
+    # (lat, lng), or None if the location could not be geocoded
+    return load_geocoder().resolve(location)
 
 # Define a function to make the API call and retrieve weather data
 def get_weather_map_data(lat, lon, api_key):
@@ -36,7 +38,8 @@ def get_weather_map_data(lat, lon, api_key):
     # http://maps.openweathermap.org/maps/2.0/weather/TA2/2/40.8358846/14.2487679?appid=4d0b923a8608e4306e8a7709350409e0&fill_bound=true&opacity=0.6&palette=-65:821692;-55:821692;-45:821692;-40:821692;-30:8257db;-20:208cec;-10:20c4e8;0:23dddd;10:c2ff28;20:fff028;25:ffc228;30:fc8014
     palette_encoded = urllib.parse.quote(palette)
     url = f"http://api.openweathermap.org/data/2.5/weather?q=94040,US&APPID={api_key}"
-    response = requests.get(url)
+    with METRICS.span("weather.request"):
+        response = TRANSPORT.get(url)
     print(url)
     print(response)
     return response.json()
@@ -69,4 +72,4 @@ if location:
     except:
         st.write("Error: Could not find location.")
 
-
+sidebar_panel(config)
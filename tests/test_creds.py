@@ -0,0 +1,61 @@
+from resources import ResourceRegistry, export_creds
+from scheduler import build_scheduler
+
+# creds.yaml as the README shows it, with the values YAML reads as int and bool
+README_CREDS = """\
+OPENAI_API_KEY: sk-test
+METRICS_PORT: 9464            # Prometheus text on http://127.0.0.1:9464/metrics
+METRICS_JSONL: metrics.jsonl  # a snapshot appended every METRICS_INTERVAL seconds (default 60)
+SHOW_METRICS: true            # a metrics panel in the Streamlit sidebar
+"""
+
+README_OPENAI_LIMITS = """\
+OPENAI_REQUESTS_PER_MINUTE: 3000
+OPENAI_TOKENS_PER_MINUTE: 250000
+OPENAI_QUEUE_DEPTH: 64                       # requests allowed to wait
+OPENAI_MAX_WAIT: 30                          # seconds
+"""
+
+
+def load(tmp_path, text):
+    path = tmp_path / "creds.yaml"
+    path.write_text(text)
+    return ResourceRegistry(str(path)).creds()
+
+
+def test_export_creds_from_readme_example(tmp_path):
+    config = load(tmp_path, README_CREDS)
+    assert config["METRICS_PORT"] == 9464 and config["SHOW_METRICS"] is True
+
+    environ = {}
+    export_creds(config, environ)
+    assert environ == {"OPENAI_API_KEY": "sk-test", "METRICS_PORT": "9464", "METRICS_JSONL": "metrics.jsonl",
+                       "SHOW_METRICS": "True"}
+
+
+def test_export_creds_skips_empty_values(tmp_path):
+    environ = {}
+    export_creds(load(tmp_path, "OPENAI_API_KEY: sk-test\nPINECONE_API_ENV:\n"), environ)
+    assert environ == {"OPENAI_API_KEY": "sk-test"}
+
+
+def test_export_creds_with_openai_limits(tmp_path):
+    environ = {}
+    export_creds(load(tmp_path, README_OPENAI_LIMITS), environ)
+    assert environ == {"OPENAI_REQUESTS_PER_MINUTE": "3000", "OPENAI_TOKENS_PER_MINUTE": "250000",
+                       "OPENAI_QUEUE_DEPTH": "64", "OPENAI_MAX_WAIT": "30"}
+
+
+def test_scheduler_reads_limits_from_creds(tmp_path):
+    path = tmp_path / "creds.yaml"
+    path.write_text(README_OPENAI_LIMITS)
+    scheduler = ResourceRegistry(str(path)).get("openai.scheduler", build_scheduler)
+    assert scheduler.enabled and scheduler.limits == (3000.0, 250000.0)
+    assert scheduler.max_queue == 64 and scheduler.max_wait == 30.0
+
+
+def test_scheduler_accepts_limits_as_strings():
+    environ = {}
+    export_creds({"OPENAI_REQUESTS_PER_MINUTE": 3000, "OPENAI_QUEUE_DEPTH": 64, "OPENAI_MAX_WAIT": 30}, environ)
+    scheduler = build_scheduler(environ)
+    assert scheduler.limits[0] == 3000.0 and scheduler.max_queue == 64 and scheduler.max_wait == 30.0
@@ -0,0 +1,64 @@
+import math
+
+import pandas as pd
+
+from map_render import (DEFAULT_CENTER, MapHtmlCache, coordinates_map, coordinates_map_html, feature_collection,
+                        map_html, places_map, places_map_html)
+
+
+def selected_places():
+    return pd.DataFrame({
+        "place_name": ["Lindos Acropolis", "Elli Beach"],
+        "rating": [4.8, 4.5],
+        "latitude": [36.0914, 36.4506],
+        "longitude": [28.0878, 28.2207],
+    })
+
+
+def layer(m):
+    # The single GeoJSON layer holding every marker
+    (geojson,) = [child for child in m._children.values() if type(child).__name__ == "GeoJson"]
+    return geojson.data
+
+
+def test_feature_collection_swaps_to_geojson_order():
+    collection = feature_collection([[36.1, 28.0]], ["Lindos"])
+    (feature,) = collection["features"]
+    assert feature["geometry"] == {"type": "Point", "coordinates": [28.0, 36.1]}
+    assert feature["properties"] == {"popup": "Lindos"}
+
+
+def test_places_map_centers_on_best_rated_place():
+    m = places_map(selected_places())
+    assert m.location == [36.0914, 28.0878]
+    assert [f["properties"]["popup"] for f in layer(m)["features"]] == ["Lindos Acropolis (4.8)", "Elli Beach (4.5)"]
+    assert "Lindos Acropolis (4.8)" in map_html(m)
+
+
+def test_places_map_with_no_places():
+    m = places_map(selected_places().iloc[:0])
+    assert m.location == list(DEFAULT_CENTER)
+    assert layer(m)["features"] == []
+    assert map_html(m)
+
+
+def test_coordinates_map_centers_on_mean():
+    m = coordinates_map({"Lindos": (36.0, 28.0), "Rhodes": (36.4, 28.2)})
+    assert all(math.isclose(a, b) for a, b in zip(m.location, [36.2, 28.1]))
+    assert len(layer(m)["features"]) == 2
+
+
+def test_coordinates_map_with_no_places():
+    m = coordinates_map({})
+    assert m.location == list(DEFAULT_CENTER)
+    assert layer(m)["features"] == []
+
+
+def test_map_html_is_cached_per_set_of_places():
+    cache = MapHtmlCache()
+    first = places_map_html(selected_places(), cache=cache)
+    assert places_map_html(selected_places(), cache=cache) is first
+    assert places_map_html(selected_places().iloc[:1], cache=cache) != first
+    assert places_map_html(selected_places().iloc[:0], cache=cache)
+    assert coordinates_map_html({}, cache=cache)
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 4
@@ -0,0 +1,44 @@
+import math
+
+import pandas as pd
+
+from places_index import PlacesIndex
+
+
+class Geocoder:
+    def __init__(self):
+        self.places = []
+
+    def resolve(self, place):
+        self.places.append(place)
+        return (36.4, 28.2)
+
+    def resolve_many(self, places):
+        return {place: self.resolve(place) for place in places}
+
+
+def index():
+    return PlacesIndex.from_frame(pd.DataFrame({
+        "place_id": [1, 2],
+        "place_name": ["Elli Beach", "Lindos Acropolis"],
+        "place_address": ["Rhodes 851 00, Greece", "Lindos, Rhodes 851 07, Greece"],
+        "has_type": ["beach", "museum"],
+        "rating": [4.8, 4.5],
+        "latitude": [36.4506, float("nan")],
+        "longitude": [28.2207, float("nan")],
+    }))
+
+
+def test_resolves_matched_names_without_geocoding():
+    names, geocoder, tally = index().names, Geocoder(), {}
+    assert names.resolve("elli beach", geocoder, tally=tally) == (36.4506, 28.2207)
+    assert geocoder.places == [] and tally == {"hits": 1, "misses": 0}
+
+
+def test_places_without_coordinates_are_geocoded():
+    names, geocoder, tally = index().names, Geocoder(), {}
+    assert names.match("Lindos Acropolis") is None
+    resolved = names.resolve_many(["Lindos Acropolis", "Elli Beach"], geocoder, tally=tally)
+    assert resolved == {"Lindos Acropolis": (36.4, 28.2), "Elli Beach": (36.4506, 28.2207)}
+    assert not any(math.isnan(value) for latlng in resolved.values() for value in latlng)
+    assert geocoder.places == ["Lindos Acropolis"] and tally == {"hits": 1, "misses": 1}
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from places_index import PlacesIndex, extract_unique_filters
+
+
+def places():
+    return pd.DataFrame({
+        "place_id": [1, 2, 3, 4],
+        "place_name": ["Lindos Acropolis", "Elli Beach", "Cafe Kos", "Faliraki Bar"],
+        "place_address": ["Lindos, Rhodes 851 07, Greece", "Rhodes 851 00, Greece", "Kos 853 00, Greece",
+                          "Faliraki 851 00, Greece"],
+        "has_type": ["museum, tourist_attraction", "beach", "cafe", None],
+        "rating": [4.8, 4.5, 4.9, 4.0],
+        "latitude": [36.0914, 36.4506, 36.8932, 36.3400],
+        "longitude": [28.0878, 28.2207, 27.2877, 28.2000],
+    })
+
+
+def test_extract_unique_filters():
+    assert extract_unique_filters(places()) == ["beach", "cafe", "museum", "tourist_attraction"]
+
+
+def test_extract_unique_filters_with_no_types():
+    assert extract_unique_filters(places().iloc[3:]) == []
+
+
+def test_top_places_by_address():
+    selected = PlacesIndex.from_frame(places()).top_places("Rhodes", ["museum", "beach"], 10)
+    assert list(selected["place_name"]) == ["Lindos Acropolis", "Elli Beach"]
+
+
+def test_top_places_with_no_match_is_empty():
+    assert PlacesIndex.from_frame(places()).top_places("Crete", ["beach"], 10).empty
+